@@ -0,0 +1,89 @@
+// Callbacks that run in the browser, so the Input tab doesn't need the server until an event is submitted
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    baby_tracker: {
+        // the current time in the format the app uses, e.g. "2021-07-5 3:04 PM"
+        now: function () {
+            var now = new Date();
+            var hours = now.getHours() % 12 || 12;
+            return now.getFullYear() + '-' + ('0' + (now.getMonth() + 1)).slice(-2) + '-' + now.getDate() + ' ' +
+                hours + ':' + ('0' + now.getMinutes()).slice(-2) + ' ' + (now.getHours() < 12 ? 'AM' : 'PM');
+        },
+
+        // true when the callback was fired by a form's submitted store, i.e. its event was just saved
+        submitted: function () {
+            var triggered = window.dash_clientside.callback_context.triggered || [];
+            return triggered.some(function (trigger) {
+                return /-submitted\.data$/.test(trigger.prop_id);
+            });
+        },
+
+        // start times show the stored time when the form is opened, or now if nothing is stored yet or the form was
+        // just submitted
+        start_time: function (n_clicks, submitted, stored) {
+            if (window.dash_clientside.baby_tracker.submitted()) {
+                return window.dash_clientside.baby_tracker.now();
+            }
+            if (n_clicks == null && stored.value !== '') {
+                return stored.value;
+            }
+            return window.dash_clientside.baby_tracker.now();
+        },
+
+        // end times show the stored time when the form is opened, now once the button is clicked, and are cleared once
+        // the form is submitted
+        end_time: function (n_clicks, submitted, stored) {
+            if (window.dash_clientside.baby_tracker.submitted()) {
+                return '';
+            }
+            if (n_clicks == null) {
+                return stored.value;
+            }
+            return window.dash_clientside.baby_tracker.now();
+        },
+
+        // clears the fields of a form after it is submitted, and leaves them alone when the form is opened
+        reset_values: function (values) {
+            if (!window.dash_clientside.baby_tracker.submitted()) {
+                return Array.isArray(values) ? values.map(function () {
+                    return window.dash_clientside.no_update;
+                }) : window.dash_clientside.no_update;
+            }
+            return values;
+        },
+
+        // source, ounces and comment of the feeding form
+        reset_feed_inputs: function (submitted) {
+            return window.dash_clientside.baby_tracker.reset_values([null, null, '']);
+        },
+
+        // type and comment of the potty form
+        reset_potty_inputs: function (submitted) {
+            return window.dash_clientside.baby_tracker.reset_values(['', '']);
+        },
+
+        // comment of the sleep form
+        reset_sleep_inputs: function (submitted) {
+            return window.dash_clientside.baby_tracker.reset_values('');
+        },
+
+        // copies an input's value into its store, so it is still there after switching tabs or reloading the page
+        store_value: function (value, stored) {
+            if (stored && value === stored.value) {
+                return window.dash_clientside.no_update;
+            }
+            return {value: value};
+        },
+
+        // shows a figure kept in a store, e.g. when switching back to the Analytics tab
+        show_figure: function (figure) {
+            return figure || window.dash_clientside.no_update;
+        },
+
+        // only shows the inputs for the selected event type
+        show_event_inputs: function (event_type) {
+            return ['Food', 'Potty', 'Sleep'].map(function (inputs_type) {
+                return {display: inputs_type === event_type ? 'block' : 'none'};
+            });
+        }
+    }
+});
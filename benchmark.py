@@ -0,0 +1,246 @@
+# Times the app's hot paths against years of synthetic events, and compares the results with a saved baseline.
+#
+#     python benchmark.py --years 3 --save-baseline    # record a baseline
+#     python benchmark.py --years 3                    # compare against it, exits with 1 on a regression
+#
+# The events are generated from --seed, so every run with the same --years and --seed works on the same history. They
+# are written as an old style Baby_Events.csv in a temporary directory, which main.py imports when it starts, so the
+# real Baby_Events.db is never touched.
+import argparse
+import csv
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+project_dir = os.path.dirname(os.path.abspath(__file__))
+
+history_start = datetime(2020, 1, 1)
+
+
+def format_time(time):
+    return time.strftime("%Y-%m-%d %I:%M %p")
+
+
+# a deterministic, roughly realistic history: a night sleep that runs past midnight, 3 or 4 naps, a feed every
+# 2.5 to 3.5 hours (alternating sides, sometimes a bottle), 6 to 8 pees and 1 to 4 poos a day
+def generate_events(years, seed=1):
+    rng = random.Random(seed)
+    events = []
+    side = "Left"
+    for day_number in range(int(years * 365)):
+        day = history_start + timedelta(days=day_number)
+
+        bedtime = day + timedelta(hours=19, minutes=rng.randint(0, 150))
+        events.append(("Sleep", bedtime, rng.randint(240, 600), None, None, None))
+        nap = day + timedelta(hours=8, minutes=rng.randint(0, 60))
+        for _ in range(rng.randint(3, 4)):
+            length = rng.randint(30, 150)
+            events.append(("Sleep", nap, length, None, None, None))
+            nap += timedelta(minutes=length + rng.randint(90, 180))
+
+        feed = day + timedelta(minutes=rng.randint(0, 120))
+        while feed.date() == day.date():
+            if rng.random() < 0.2:
+                events.append(("Food", feed, rng.randint(10, 20), "Bottle", rng.choice([2, 2.5, 3, 3.5, 4, 5]),
+                               None))
+            else:
+                events.append(("Food", feed, rng.randint(8, 35), side, None,
+                               "fussy" if rng.random() < 0.05 else None))
+                side = "Right" if side == "Left" else "Left"
+            feed += timedelta(minutes=rng.randint(150, 210))
+
+        for event_type, count in (("Pee", rng.randint(6, 8)), ("Poo", rng.randint(1, 4))):
+            for _ in range(count):
+                events.append((event_type, day + timedelta(minutes=rng.randint(0, 24 * 60 - 1)), 0, None, None,
+                               "blowout" if event_type == "Poo" and rng.random() < 0.05 else None))
+    events.sort(key=lambda event: event[1])
+    return events
+
+
+# writes the events in the csv format of the first versions of the app, which main.py imports on startup
+def write_legacy_csv(events, path):
+    with open(path, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["Event Type", "Start", "Duration", "Source", "Ounces", "Comment"])
+        for event_type, start, minutes, source, ounces, comment in events:
+            writer.writerow([event_type, format_time(start), "%dh %dm" % (minutes // 60, minutes % 60),
+                             source or "", "" if ounces is None else ounces, comment or ""])
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+# runs setup() then run() repeat times, timing only run(), then once more under tracemalloc for the peak memory
+def measure(setup, run, repeat):
+    latencies = []
+    for _ in range(repeat):
+        setup()
+        started = time.perf_counter()
+        run()
+        latencies.append(time.perf_counter() - started)
+    setup()
+    tracemalloc.start()
+    run()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    latencies.sort()
+    return {
+        "p50_ms": 1000 * percentile(latencies, 0.5),
+        "p95_ms": 1000 * percentile(latencies, 0.95),
+        "p99_ms": 1000 * percentile(latencies, 0.99),
+        "max_ms": 1000 * latencies[-1],
+        "peak_mb": peak_memory / 2 ** 20,
+    }
+
+
+def benchmarks(main, rng):
+    # time the views as they are built on request, and keep background rebuilds after the submits from running
+    # during the other timings
+    main.response_cache.hot_seconds = 0
+    stored_inputs = [{"value": ""}] * len(main.store_id_prefix)
+    last_start = main.event_store.last_n(1)["Start"][0].to_pydatetime()
+
+    def cold():
+        # forget everything the app caches, as after a change to the events
+        main.response_cache.clear()
+        main.gantt_segment_cache.invalidate(None)
+
+    def warm():
+        pass
+
+    def edit_table():
+        rows, _ = main.table_page(0, main.events_to_display)
+        previous_rows = [dict(row) for row in rows]
+        rows = [dict(row) for row in rows]
+        rows[rng.randrange(len(rows))]["Comment"] = "edited %d" % rng.randrange(10 ** 6)
+        main.table_manually_updated.__wrapped__(time.time(), rows, previous_rows, columns)
+
+    def delete_table_row():
+        rows, _ = main.table_page(0, main.events_to_display)
+        previous_rows = list(rows)
+        rows = list(rows)
+        del rows[rng.randrange(len(rows))]
+        main.table_manually_updated.__wrapped__(time.time(), rows, previous_rows, columns)
+
+    columns = [{'id': column, 'name': column} for column in main.table_columns]
+
+    def submit_feed():
+        start = last_start + timedelta(minutes=rng.randrange(24 * 60))
+        main.submit_feed_event.__wrapped__(1, "Food", format_time(start), format_time(start + timedelta(minutes=20)),
+                                           "Left", None, "")
+
+    def submit_potty():
+        main.submit_potty_event.__wrapped__(1, format_time(last_start + timedelta(minutes=rng.randrange(24 * 60))),
+                                            "Pee", "")
+
+    def submit_sleep():
+        start = last_start + timedelta(minutes=rng.randrange(24 * 60))
+        main.submit_sleep_event.__wrapped__(1, "Sleep", format_time(start), format_time(start + timedelta(hours=2)),
+                                            "")
+
+    def submit_burst():
+        # 8 phones submitting at the same moment, the writer thread commits them together
+        threads = [threading.Thread(target=submit_potty) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    return [
+        ("create_gantt_fig 7 days (cold)", cold, lambda: main.create_gantt_fig(7)),
+        ("create_gantt_fig 7 days", warm, lambda: main.create_gantt_fig(7)),
+        # a submit changes the data version and one day of the chart
+        ("create_gantt_fig after a submit", submit_potty, lambda: main.create_gantt_fig(7)),
+        ("create_gantt_fig 90 days (cold)", cold, lambda: main.create_gantt_fig(90)),
+        ("create_trends_fig (cold)", cold, lambda: main.create_trends_fig()),
+        ("create_patterns_fig 365 days (cold)", cold, lambda: main.create_patterns_fig(365)),
+        ("render_content Input", cold, lambda: main.render_content.__wrapped__("event-input", *stored_inputs)),
+        ("render_content History (cold)", cold, lambda: main.render_content.__wrapped__("tables", *stored_inputs)),
+        ("render_content History", warm, lambda: main.render_content.__wrapped__("tables", *stored_inputs)),
+        ("render_content Analytics (cold)", cold, lambda: (
+            main.render_content.__wrapped__("visuals", *stored_inputs),
+            main.update_analytics_figures.__wrapped__(7, None, None, None))),
+        ("render_content Analytics", warm, lambda: (
+            main.render_content.__wrapped__("visuals", *stored_inputs),
+            main.update_analytics_figures.__wrapped__(7, None, None, None))),
+        ("table_manually_updated edit", warm, edit_table),
+        ("table_manually_updated delete", warm, delete_table_row),
+        ("submit_feed_event", warm, submit_feed),
+        ("submit_potty_event", warm, submit_potty),
+        ("submit_sleep_event", warm, submit_sleep),
+        ("submit burst of 8", warm, submit_burst),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times the app's hot paths against synthetic events")
+    parser.add_argument("--years", type=float, default=1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--baseline", default=os.path.join(project_dir, "benchmark_baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="flag a regression when the median is this much slower than the baseline")
+    args = parser.parse_args()
+
+    run_dir = tempfile.mkdtemp()
+    os.chdir(run_dir)
+    sys.path.insert(0, project_dir)
+    try:
+        events = generate_events(args.years, args.seed)
+        write_legacy_csv(events, os.path.join(run_dir, "Baby_Events.csv"))
+        started = time.perf_counter()
+        import main as app_main
+        print("%d events, imported and started in %.1f s" % (len(events), time.perf_counter() - started))
+
+        results = {}
+        print("%-34s %9s %9s %9s %9s %8s" % ("", "p50 ms", "p95 ms", "p99 ms", "max ms", "peak MB"))
+        for name, setup, run in benchmarks(app_main, random.Random(args.seed)):
+            results[name] = measure(setup, run, args.repeat)
+            print("%-34s %9.1f %9.1f %9.1f %9.1f %8.1f" % ((name,) + tuple(
+                results[name][key] for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms", "peak_mb"))))
+        # ru_maxrss is in kilobytes on Linux
+        print("process peak RSS: %.0f MB" % (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+    finally:
+        os.chdir(project_dir)
+        shutil.rmtree(run_dir)
+
+    baseline_key = "%g years, seed %d" % (args.years, args.seed)
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baselines = json.load(baseline_file)
+
+    if args.save_baseline:
+        baselines[baseline_key] = results
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(baselines, baseline_file, indent=2, sort_keys=True)
+        print("saved as the baseline for %s in %s" % (baseline_key, args.baseline))
+        return
+
+    baseline = baselines.get(baseline_key)
+    if baseline is None:
+        print("no baseline for %s yet, save one with --save-baseline" % baseline_key)
+        return
+    # differences of under a millisecond are timer noise, even when they are more than the threshold
+    regressions = [(name, baseline[name]["p50_ms"], result["p50_ms"]) for name, result in results.items()
+                   if name in baseline and result["p50_ms"] > baseline[name]["p50_ms"] * (1 + args.threshold)
+                   and result["p50_ms"] - baseline[name]["p50_ms"] > 1]
+    for name, baseline_ms, result_ms in regressions:
+        print("REGRESSION %s: median %.1f ms, baseline %.1f ms" % (name, result_ms, baseline_ms))
+    if regressions:
+        sys.exit(1)
+    print("no regressions beyond %d%% of the baseline" % (100 * args.threshold))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,843 @@
+import csv
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from lazy_import import LazyModule
+
+pd = LazyModule("pandas")
+
+logger = logging.getLogger("baby_tracker.event_store")
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+# the canonical event columns used by the app, mapped to the columns in the database
+event_columns = OrderedDict([
+    ("Event Type", "event_type"),
+    ("Start", "start"),
+    ("DurationMinutes", "duration_minutes"),
+    ("Source", "source"),
+    ("Ounces", "ounces"),
+    ("Comment", "comment"),
+])
+
+event_types = ("Food", "Sleep", "Pee", "Poo")
+food_sources = ("Left", "Right", "Bottle")
+
+# start times are stored as whole minutes since 1970-01-01 00:00 (local time), durations as whole minutes
+epoch = datetime(1970, 1, 1)
+
+schema_version = 4
+
+schema = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_type TEXT NOT NULL CHECK (event_type IN ('Food', 'Sleep', 'Pee', 'Poo')),
+    start INTEGER NOT NULL,
+    duration_minutes INTEGER NOT NULL DEFAULT 0 CHECK (duration_minutes >= 0),
+    source TEXT CHECK (source IN ('Left', 'Right', 'Bottle')),
+    ounces REAL CHECK (ounces >= 0),
+    comment TEXT
+);
+CREATE INDEX IF NOT EXISTS events_start ON events (start, id);
+CREATE INDEX IF NOT EXISTS events_type_start ON events (event_type, start, id);
+CREATE INDEX IF NOT EXISTS events_source_start ON events (source, start, id);
+-- for the longest event, which says how far back events can reach into a day
+CREATE INDEX IF NOT EXISTS events_duration ON events (duration_minutes);
+-- totals per calendar day (days since 1970-01-01), event type and source ('' when there is none), kept up to date
+-- with every change. Durations are split at midnight, wake windows (from the end of a sleep to the start of the next
+-- one) are counted on the Sleep row of the day they start.
+CREATE TABLE IF NOT EXISTS daily_rollups (
+    day INTEGER NOT NULL,
+    event_type TEXT NOT NULL,
+    source TEXT NOT NULL DEFAULT '',
+    events INTEGER NOT NULL DEFAULT 0,
+    duration_minutes INTEGER NOT NULL DEFAULT 0,
+    ounces REAL NOT NULL DEFAULT 0,
+    wake_windows INTEGER NOT NULL DEFAULT 0,
+    wake_minutes INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, event_type, source)
+);
+-- every change to an event gets the next data version, so a client can ask what changed since the version it has
+CREATE TABLE IF NOT EXISTS changes (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_id INTEGER NOT NULL,
+    operation TEXT NOT NULL CHECK (operation IN ('insert', 'update', 'delete')),
+    old_start INTEGER,
+    old_duration_minutes INTEGER,
+    new_start INTEGER,
+    new_duration_minutes INTEGER
+);
+CREATE TRIGGER IF NOT EXISTS events_inserted AFTER INSERT ON events BEGIN
+    INSERT INTO changes (event_id, operation, new_start, new_duration_minutes)
+    VALUES (NEW.id, 'insert', NEW.start, NEW.duration_minutes);
+END;
+CREATE TRIGGER IF NOT EXISTS events_updated AFTER UPDATE ON events BEGIN
+    INSERT INTO changes (event_id, operation, old_start, old_duration_minutes, new_start, new_duration_minutes)
+    VALUES (NEW.id, 'update', OLD.start, OLD.duration_minutes, NEW.start, NEW.duration_minutes);
+END;
+CREATE TRIGGER IF NOT EXISTS events_deleted AFTER DELETE ON events BEGIN
+    INSERT INTO changes (event_id, operation, old_start, old_duration_minutes)
+    VALUES (OLD.id, 'delete', OLD.start, OLD.duration_minutes);
+END;
+"""
+
+
+# creates whatever is missing of the schema with one execute() per statement, unlike executescript() this doesn't commit
+# the transaction it is called in
+def _create_schema(conn):
+    statement = ""
+    for line in schema.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ""
+
+
+# event time formats accepted from the app, the first one is the one the app writes
+event_time_formats = ("%Y-%m-%d %I:%M %p", "%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S")
+# older versions of the input tab pre-filled times with the date written twice, e.g. "2021-7-5 2021-07-5 3:04 PM"
+repeated_date_pattern = re.compile(r"^\s*\d{4}-\d{1,2}-\d{1,2}\s+(?=\d{4}-\d{1,2}-\d{1,2}\s)")
+duration_pattern = re.compile(r"^\s*(?:(?P<hours>\d+)\s*h)?\s*(?:(?P<minutes>\d+)\s*m?)?\s*$")
+
+
+def parse_event_time(text):
+    text = repeated_date_pattern.sub("", text).strip()
+    for time_format in event_time_formats:
+        try:
+            return datetime.strptime(text, time_format)
+        except ValueError:
+            pass
+    raise ValueError("'%s' is not a valid time, use e.g. 2021-07-05 3:04 PM" % text)
+
+
+def parse_duration(text):
+    match = duration_pattern.match(text or "")
+    if match is None:
+        raise ValueError("'%s' is not a valid duration, use e.g. 1h 25m" % text)
+    return int(match.group("hours") or 0) * 60 + int(match.group("minutes") or 0)
+
+
+def format_duration(minutes):
+    return "%dh %dm" % (minutes // 60, minutes % 60)
+
+
+def to_epoch_minutes(time):
+    return int((time - epoch) // timedelta(minutes=1))
+
+
+def from_epoch_minutes(minutes):
+    return epoch + timedelta(minutes=int(minutes))
+
+
+def _is_missing(value):
+    return value is None or value == "" or (isinstance(value, float) and value != value)
+
+
+def _to_db_value(column, value):
+    if column == "event_type":
+        if value not in event_types:
+            raise ValueError("'%s' is not an event type, use one of: %s" % (value, ", ".join(event_types)))
+        return value
+    if column == "start":
+        if _is_missing(value):
+            raise ValueError("Start time is missing")
+        return to_epoch_minutes(value if isinstance(value, datetime) else parse_event_time(str(value)))
+    if column == "duration_minutes":
+        minutes = 0 if _is_missing(value) else int(value)
+        if minutes < 0:
+            raise ValueError("The end time is before the start time")
+        return minutes
+    if _is_missing(value):
+        return None
+    if column == "source":
+        if value not in food_sources:
+            raise ValueError("'%s' is not a food source, use one of: %s" % (value, ", ".join(food_sources)))
+        return value
+    if column == "ounces":
+        ounces = float(value)
+        if ounces < 0:
+            raise ValueError("Ounces can't be negative")
+        return ounces
+    return str(value)
+
+
+# validates an event (or just the changed fields of one when partial) and converts it to a database row
+def validate_event(event, partial=False):
+    if not partial:
+        event = dict(event)
+        for column in ("Event Type", "Start"):
+            if column not in event:
+                raise ValueError("%s is missing" % column)
+        event.setdefault("DurationMinutes", 0)
+    return OrderedDict((db_col, _to_db_value(db_col, event[col])) for col, db_col in event_columns.items()
+                       if col in event)
+
+
+# the columns every old csv event file has
+legacy_csv_columns = ("Event Type", "Start", "Duration")
+
+
+# converts events in the old csv format (free text Start, Duration like "1h 25m") to database rows, as (position in
+# legacy_events, row). Events that can't be converted (hand edited files have e.g. blank types or negative durations)
+# are left out and logged, they are returned as (position, error) so they can be kept somewhere.
+def _legacy_events_to_rows(legacy_events):
+    legacy_events = legacy_events.where(legacy_events.notna(), None)
+    rows, rejected = [], []
+    for line, event in enumerate(legacy_events.to_dict("records")):
+        try:
+            event["DurationMinutes"] = parse_duration(event.pop("Duration", None))
+            if isinstance(event["Start"], str):
+                # hand edited files may have other time formats, which pandas can usually still work out
+                try:
+                    event["Start"] = parse_event_time(event["Start"])
+                except ValueError:
+                    event["Start"] = pd.Timestamp(event["Start"]).to_pydatetime()
+            rows.append((line, validate_event(event)))
+        except (ValueError, TypeError) as e:
+            logger.warning("skipping event %d (%s): %s", line + 1, event, e)
+            rejected.append((line, str(e)))
+    return rows, rejected
+
+
+# writes the legacy events that couldn't be converted to a csv file, with the reason in an Error column, so they can
+# be fixed by hand and imported
+def _save_rejected_events(legacy_events, rejected, path):
+    if not rejected:
+        return
+    positions, errors = zip(*rejected)
+    legacy_events.iloc[list(positions)].assign(Error=list(errors)).to_csv(path, index=False)
+    logger.warning("%d events could not be converted, they were saved to %s", len(rejected), path)
+
+
+minutes_per_day = 24 * 60
+
+# the columns of a rollup, in the order they are kept in the rollup totals
+rollup_columns = OrderedDict([
+    ("Events", "events"),
+    ("DurationMinutes", "duration_minutes"),
+    ("Ounces", "ounces"),
+    ("WakeWindows", "wake_windows"),
+    ("WakeMinutes", "wake_minutes"),
+])
+
+
+# the minutes of an event that fall on each calendar day, as (day, minutes)
+def _minutes_per_day(start, duration_minutes):
+    end = start + duration_minutes
+    days = []
+    while start < end:
+        day_end = (start // minutes_per_day + 1) * minutes_per_day
+        days.append((start // minutes_per_day, min(end, day_end) - start))
+        start = day_end
+    return days
+
+
+# adds (sign 1) or takes away (sign -1) an event's row from the rollup totals
+def _add_event_rollup(totals, row, sign):
+    key = (row["start"] // minutes_per_day, row["event_type"], row["source"] or "")
+    totals[key][0] += sign
+    totals[key][2] += sign * (row["ounces"] or 0)
+    for day, minutes in _minutes_per_day(row["start"], row["duration_minutes"]):
+        totals[(day, row["event_type"], row["source"] or "")][1] += sign * minutes
+
+
+# adds or takes away the wake window between two sleeps that follow each other, either may be None
+def _add_wake_window(totals, earlier_sleep, later_sleep, sign):
+    if earlier_sleep is None or later_sleep is None:
+        return
+    awake_at = earlier_sleep["start"] + earlier_sleep["duration_minutes"]
+    key = (awake_at // minutes_per_day, "Sleep", "")
+    totals[key][3] += sign
+    totals[key][4] += sign * max(later_sleep["start"] - awake_at, 0)
+
+
+def _new_rollup_totals():
+    return defaultdict(lambda: [0, 0, 0.0, 0, 0])
+
+
+# the WHERE clause and its parameters for the events with start <= Start < end, where start and end are dates or
+# times. Start times are stored to the minute, so the bounds are rounded down to the minute.
+def _range_conditions(start=None, end=None):
+    conditions, params = [], []
+    for bound, condition in ((start, "start >= ?"), (end, "start < ?")):
+        if bound is not None:
+            if not isinstance(bound, datetime):
+                bound = datetime.combine(bound, datetime.min.time())
+            conditions.append(condition)
+            params.append(to_epoch_minutes(bound))
+    return "WHERE " + " AND ".join(conditions) if conditions else "", params
+
+
+# the most writes the writer thread commits together in one transaction
+max_write_batch = 100
+# how many of the latest changes are kept in the change log, clients further behind than that reload everything
+change_log_size = 10000
+
+
+# an exclusive lock on a file next to the database, held across processes (e.g. several app workers starting up)
+@contextmanager
+def _file_lock(path):
+    with open(path + ".lock", "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class _QueuedWrite:
+    def __init__(self, run):
+        # run() makes the change and returns (result, changed events), it is called by the writer thread
+        self.run = run
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class EventStore:
+    def __init__(self, path="Baby_Events.db"):
+        self.path = path
+        # a single connection shared by all of the Dash worker threads, guarded by a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, _file_lock(path):
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # sync the write ahead log on every commit, so a committed event survives a power cut
+            self._conn.execute("PRAGMA synchronous=FULL")
+            with self._conn:
+                # the whole upgrade is one transaction, so a power cut part way through leaves the database as it was
+                self._conn.execute("BEGIN IMMEDIATE")
+                previous_version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+                migrated = self._migrate_schema()
+                _create_schema(self._conn)
+                if previous_version < 4 or migrated:
+                    # databases from before the rollups were added get them built once
+                    self._rebuild_rollups()
+                self._conn.execute("PRAGMA user_version = %d" % schema_version)
+        # counts the writes made through this store, PRAGMA data_version only changes for writes by other connections
+        self._writes = 0
+        # guards the cached versions and last events below
+        self._cache_lock = threading.Lock()
+        # rows read and written by each thread, for the metrics
+        self._io = threading.local()
+        # (data_version(), version()) as of the last call to version()
+        self._cached_version = None
+        # (data_version(), last events) as of the last call to last_events()
+        self._cached_last_events = None
+        # functions called with the old and new versions of the events changed through this store,
+        # or with None when too many events changed to list them
+        self._listeners = []
+        # every change goes through one writer thread, which commits whatever has queued up in one transaction
+        self._write_queue = queue.Queue()
+        threading.Thread(target=self._writer, name="event-store-writer", daemon=True).start()
+
+    # converts a database written by an older version of the app to the current schema, events that can't be converted
+    # are skipped and saved to <database>.rejected. Returns whether there was anything to convert. Must be called with
+    # self._lock held, in a transaction.
+    def _migrate_schema(self):
+        tables = [row[0] for row in self._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        if "legacy_events" in tables:
+            # older versions of the app didn't upgrade in one transaction, and one cut off after renaming the table
+            # left the events there behind a new, empty events table: finish copying them
+            logger.warning("resuming an upgrade of %s that was cut off", self.path)
+        elif "events" in tables and "duration_minutes" not in [
+                row[1] for row in self._conn.execute("PRAGMA table_info(events)")]:
+            self._conn.execute("DROP INDEX IF EXISTS events_start")
+            self._conn.execute("ALTER TABLE events RENAME TO legacy_events")
+        else:
+            return False
+        # version 1 stored Start as "YYYY-MM-DD HH:MM" text and Duration as text like "1h 25m"
+        legacy_events = pd.read_sql_query(
+            'SELECT id, event_type AS "Event Type", start AS "Start", duration AS "Duration", source AS "Source", '
+            'ounces AS "Ounces", comment AS "Comment" FROM legacy_events ORDER BY id', self._conn)
+        rows, rejected = _legacy_events_to_rows(legacy_events.drop("id", axis=1))
+        _save_rejected_events(legacy_events, rejected, self.path + ".rejected")
+        _create_schema(self._conn)
+        # events added since an upgrade was cut off may have taken some of the ids, those events get new ones after
+        # the others are in, so the new ids can't take the ids of events still to be copied
+        taken_ids = {row[0] for row in self._conn.execute("SELECT id FROM events")}
+        event_ids = [None if event_id in taken_ids else event_id for event_id in legacy_events["id"].tolist()]
+        rows.sort(key=lambda line_row: event_ids[line_row[0]] is None)
+        self._conn.executemany("INSERT INTO events (id, %s) VALUES (?, %s)" % (
+            ", ".join(event_columns.values()), ", ".join("?" * len(event_columns))),
+            [[event_ids[line]] + [row.get(db_col) for db_col in event_columns.values()] for line, row in rows])
+        self._conn.execute("DROP TABLE legacy_events")
+        return True
+
+    # the number of event rows read and written by the calling thread so far
+    def io_counters(self):
+        return getattr(self._io, "rows_read", 0), getattr(self._io, "rows_written", 0)
+
+    def _count_io(self, rows_read=0, rows_written=0):
+        self._io.rows_read = getattr(self._io, "rows_read", 0) + rows_read
+        self._io.rows_written = getattr(self._io, "rows_written", 0) + rows_written
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    # a listener that fails is logged, it must not stop the writer thread or the other listeners
+    def _notify(self, changed_events):
+        for listener in self._listeners:
+            try:
+                listener(changed_events)
+            except Exception:
+                logger.exception("event store listener %r failed", listener)
+
+    def data_version(self):
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0], self._writes
+
+    # the data version of the events, it goes up by one with every change from any process and never goes down
+    def version(self):
+        data_version = self.data_version()
+        with self._cache_lock:
+            if self._cached_version is not None and self._cached_version[0] == data_version:
+                return self._cached_version[1]
+        with self._lock:
+            version = self._conn.execute("SELECT MAX(version) FROM changes").fetchone()[0] or 0
+        with self._cache_lock:
+            self._cached_version = data_version, version
+        return version
+
+    # the current data version and the changes made since an earlier one, oldest first. Each change is a dict with
+    # the version, the event id, the operation (insert, update or delete) and the "Old" and "New" Start and
+    # DurationMinutes of the event (None for the side that doesn't exist). The changes are None when the change log
+    # doesn't go back that far, then everything has to be read again.
+    def changes(self, since):
+        with self._lock:
+            first_version, version = self._conn.execute("SELECT MIN(version), MAX(version) FROM changes").fetchone()
+            version = version or 0
+            if since == version:
+                return version, []
+            if since > version or first_version is None or since < first_version - 1:
+                return version, None
+            rows = self._conn.execute(
+                "SELECT version, event_id, operation, old_start, old_duration_minutes, new_start, new_duration_minutes "
+                "FROM changes WHERE version > ? AND version <= ? ORDER BY version", (since, version)).fetchall()
+        changes = []
+        for change_version, event_id, operation, old_start, old_duration, new_start, new_duration in rows:
+            changes.append({
+                "version": change_version,
+                "id": event_id,
+                "operation": operation,
+                "Old": None if old_start is None else {"Start": from_epoch_minutes(old_start),
+                                                        "DurationMinutes": old_duration},
+                "New": None if new_start is None else {"Start": from_epoch_minutes(new_start),
+                                                        "DurationMinutes": new_duration},
+            })
+        return version, changes
+
+    # the most recent event (by Start) of each event type and of each food source, or None if there isn't one yet:
+    # {"Event Type": {"Food": event, ...}, "Source": {"Left": event, ...}}, each event with its "End" as well.
+    # Each is one lookup on an index, and the answer is kept until the data version changes.
+    def last_events(self):
+        data_version = self.data_version()
+        with self._cache_lock:
+            if self._cached_last_events is not None and self._cached_last_events[0] == data_version:
+                return self._copy_last_events(self._cached_last_events[1])
+        query = "SELECT id, %s FROM events WHERE %%s = ? ORDER BY start DESC, id DESC LIMIT 1" % ", ".join(
+            event_columns.values())
+        last_events = {"Event Type": OrderedDict(), "Source": OrderedDict()}
+        with self._lock:
+            for column, db_col, values in (("Event Type", "event_type", event_types),
+                                           ("Source", "source", food_sources)):
+                for value in values:
+                    row = self._conn.execute(query % db_col, (value,)).fetchone()
+                    if row is None:
+                        last_events[column][value] = None
+                        continue
+                    event = self._row_to_event(dict(zip(["id"] + list(event_columns.values()), row)))
+                    event["End"] = event["Start"] + timedelta(minutes=event["DurationMinutes"])
+                    last_events[column][value] = event
+        with self._cache_lock:
+            self._cached_last_events = data_version, last_events
+        return self._copy_last_events(last_events)
+
+    @staticmethod
+    def _copy_last_events(last_events):
+        return {column: OrderedDict((value, None if event is None else dict(event)) for value, event in events.items())
+                for column, events in last_events.items()}
+
+    # the database row of an event, keyed by the database column names, must be called with self._lock held
+    def _get_row(self, event_id):
+        row = self._conn.execute("SELECT id, %s FROM events WHERE id = ?" % ", ".join(event_columns.values()),
+                                 (event_id,)).fetchone()
+        return None if row is None else dict(zip(["id"] + list(event_columns.values()), row))
+
+    @staticmethod
+    def _row_to_event(row):
+        event = {col: row[db_col] for col, db_col in event_columns.items()}
+        event["id"] = row["id"]
+        event["Start"] = from_epoch_minutes(event["Start"])
+        return event
+
+    # the sleep just before (or just after) a sleep in Start order, leaving the sleep itself out, must be called with
+    # self._lock held
+    def _neighbouring_sleep(self, sleep, after):
+        row = self._conn.execute(
+            "SELECT id, %s FROM events WHERE event_type = 'Sleep' AND (start %s ? OR (start = ? AND id %s ?)) "
+            "ORDER BY start %s, id %s LIMIT 1" % (", ".join(event_columns.values()), ">" if after else "<",
+                                                  ">" if after else "<", "ASC" if after else "DESC",
+                                                  "ASC" if after else "DESC"),
+            (sleep["start"], sleep["start"], sleep["id"])).fetchone()
+        return None if row is None else dict(zip(["id"] + list(event_columns.values()), row))
+
+    # adds (sign 1) or takes away (sign -1) an event from the rollups, called while the event is in the database
+    # (before it is changed or deleted, or after it is inserted or changed), with self._lock held. Pass totals to
+    # collect the change there instead of saving it straight away, for changing many events at once.
+    def _update_rollups(self, row, sign, totals=None):
+        save = totals is None
+        if save:
+            totals = _new_rollup_totals()
+        _add_event_rollup(totals, row, sign)
+        if row["event_type"] == "Sleep":
+            # the sleep splits (or joins back up) the wake window between the sleeps either side of it
+            before, after = self._neighbouring_sleep(row, after=False), self._neighbouring_sleep(row, after=True)
+            _add_wake_window(totals, before, row, sign)
+            _add_wake_window(totals, row, after, sign)
+            _add_wake_window(totals, before, after, -sign)
+        if save:
+            self._save_rollups(totals)
+
+    # must be called with self._lock held
+    def _save_rollups(self, totals):
+        for (day, event_type, source), (events, minutes, ounces, windows, wake_minutes) in totals.items():
+            self._conn.execute("INSERT OR IGNORE INTO daily_rollups (day, event_type, source) VALUES (?, ?, ?)",
+                               (day, event_type, source))
+            self._conn.execute(
+                "UPDATE daily_rollups SET events = events + ?, duration_minutes = duration_minutes + ?, "
+                "ounces = ROUND(ounces + ?, 4), wake_windows = wake_windows + ?, wake_minutes = wake_minutes + ? "
+                "WHERE day = ? AND event_type = ? AND source = ?",
+                (events, minutes, ounces, windows, wake_minutes, day, event_type, source))
+            self._conn.execute("DELETE FROM daily_rollups WHERE day = ? AND event_type = ? AND source = ? "
+                               "AND events = 0 AND duration_minutes = 0 AND wake_windows = 0",
+                               (day, event_type, source))
+
+    # builds the rollups from scratch, for bulk imports, must be called with self._lock held
+    def _rebuild_rollups(self):
+        totals = _new_rollup_totals()
+        previous_sleep = None
+        for row in self._conn.execute("SELECT id, %s FROM events ORDER BY event_type, start, id" %
+                                      ", ".join(event_columns.values())):
+            row = dict(zip(["id"] + list(event_columns.values()), row))
+            _add_event_rollup(totals, row, 1)
+            if row["event_type"] == "Sleep":
+                _add_wake_window(totals, previous_sleep, row, 1)
+                previous_sleep = row
+        self._conn.execute("DELETE FROM daily_rollups")
+        self._save_rollups(totals)
+
+    # queues a change for the writer thread and waits until it has been committed
+    def _write(self, run):
+        write = _QueuedWrite(run)
+        self._write_queue.put(write)
+        write.done.wait()
+        if write.error is not None:
+            raise write.error
+        return write.result
+
+    def _writer(self):
+        while True:
+            writes = [self._write_queue.get()]
+            while len(writes) < max_write_batch:
+                try:
+                    writes.append(self._write_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            # every write is marked done whatever happens, a caller waiting in _write() must never be left hanging
+            try:
+                self._commit_writes(writes)
+            except Exception:
+                logger.exception("the event store writer failed")
+            finally:
+                for write in writes:
+                    write.done.set()
+
+    def _commit_writes(self, writes):
+        changed_events = []
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                for write in writes:
+                    # a savepoint per write, so one bad write doesn't undo the rest of the batch
+                    self._conn.execute("SAVEPOINT queued_write")
+                    try:
+                        write.result, write_changes = write.run()
+                        self._conn.execute("RELEASE queued_write")
+                    except Exception as e:
+                        self._conn.execute("ROLLBACK TO queued_write")
+                        self._conn.execute("RELEASE queued_write")
+                        write.error = e
+                        continue
+                    if write_changes is None or changed_events is None:
+                        changed_events = None
+                    else:
+                        changed_events += write_changes
+                self._conn.execute("DELETE FROM changes WHERE version <= (SELECT MAX(version) FROM changes) - ?",
+                                   (change_log_size,))
+                self._conn.commit()
+                self._writes += 1
+            except Exception as e:
+                if self._conn.in_transaction:
+                    self._conn.rollback()
+                for write in writes:
+                    write.error = write.error or e
+                return
+
+        if changed_events is None or changed_events:
+            self._notify(changed_events)
+
+    def _write_event(self, event_id, query, params):
+        # makes a change to a single event and returns what the event looked like before and after it
+        def run():
+            old_row = self._get_row(event_id) if event_id is not None else None
+            if old_row is not None:
+                self._update_rollups(old_row, -1)
+            cursor = self._conn.execute(query, params)
+            new_row = self._get_row(event_id if event_id is not None else cursor.lastrowid)
+            if new_row is not None:
+                self._update_rollups(new_row, 1)
+            return cursor.lastrowid, [self._row_to_event(row) for row in (old_row, new_row) if row is not None]
+
+        result = self._write(run)
+        self._count_io(rows_written=1)
+        return result
+
+    def _read(self, where="", params=(), order_by="start, id", limit=None, offset=0):
+        query = "SELECT id, %s FROM events %s ORDER BY %s" % (
+            ", ".join('%s AS "%s"' % (db_col, col) for col, db_col in event_columns.items()), where, order_by)
+        if limit is not None:
+            query += " LIMIT %d OFFSET %d" % (limit, offset)
+        with self._lock:
+            events = pd.read_sql_query(query, self._conn, params=params)
+        self._count_io(rows_read=len(events))
+        # the columns are already typed, so no text has to be parsed
+        events["Event Type"] = pd.Categorical(events["Event Type"], categories=event_types)
+        events["Start"] = pd.to_datetime(events["Start"], unit="m")
+        events["DurationMinutes"] = events["DurationMinutes"].astype("int64")
+        events["Source"] = pd.Categorical(events["Source"], categories=food_sources)
+        events["Ounces"] = events["Ounces"].astype(float)
+        return events
+
+    def append(self, event):
+        row = validate_event(event)
+        return self._write_event(None, "INSERT INTO events (%s) VALUES (%s)" % (
+            ", ".join(row), ", ".join("?" * len(row))), list(row.values()))
+
+    def update(self, event_id, changes):
+        row = validate_event(changes, partial=True)
+        if not row:
+            return
+        self._write_event(event_id, "UPDATE events SET %s WHERE id = ?" % ", ".join("%s = ?" % col for col in row),
+                    list(row.values()) + [event_id])
+
+    def delete(self, event_id):
+        self._write_event(event_id, "DELETE FROM events WHERE id = ?", (event_id,))
+
+    # all events with start <= Start < end, oldest first. Only the rows in the range are read, found with the Start
+    # index, so this costs the same no matter how much history there is
+    def range(self, start=None, end=None):
+        where, params = _range_conditions(start, end)
+        return self._read(where, params)
+
+    # the minutes of the longest event, read from the end of the duration index
+    def max_duration(self):
+        with self._lock:
+            return self._conn.execute("SELECT MAX(duration_minutes) FROM events").fetchone()[0] or 0
+
+    # the n most recent events, newest first, read by walking the Start index backwards from the end
+    def last_n(self, n):
+        return self._read(order_by="start DESC, id DESC", limit=n)
+
+    # one page of events matching the filters, sorted by sort_by (newest first by default), and the number of
+    # events matching the filters. sort_by is a list of (column, ascending) and filters a list of
+    # (column, operator, value), with the operators: = != < <= > >= contains datestartswith
+    def page(self, offset, limit, sort_by=(), filters=()):
+        conditions, params = [], []
+        for column, operator, value in filters:
+            db_col = event_columns[column]
+            if db_col == "start" and operator in ("contains", "datestartswith"):
+                # a start time "starting with" 2021-07 is one in that year, month, day, ... so use a range
+                try:
+                    period = pd.Period(value)
+                    params += [to_epoch_minutes(period.start_time), to_epoch_minutes((period + 1).start_time)]
+                except ValueError:
+                    # e.g. a time without a date, which pandas puts in the year 1
+                    raise ValueError("'%s' is not a date, use e.g. 2021-07-05 or 2021-07" % value)
+                conditions.append("start >= ? AND start < ?")
+            elif operator == "contains":
+                conditions.append("%s LIKE ?" % db_col)
+                params.append("%%%s%%" % value)
+            elif operator == "datestartswith":
+                conditions.append("%s LIKE ?" % db_col)
+                params.append("%s%%" % value)
+            elif operator in ("=", "!=", "<", "<=", ">", ">="):
+                conditions.append("%s %s ?" % (db_col, operator))
+                if db_col == "start":
+                    try:
+                        params.append(to_epoch_minutes(pd.Timestamp(value)))
+                    except ValueError:
+                        raise ValueError("'%s' is not a time, use e.g. 2021-07-05 3:04 PM" % value)
+                else:
+                    params.append(_to_db_value(db_col, value))
+            else:
+                raise ValueError("Unknown filter operator: %s" % operator)
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+
+        order_by = ["%s %s" % (event_columns[column], "ASC" if ascending else "DESC") for column, ascending in sort_by]
+        order_by = ", ".join(order_by + ["start DESC", "id DESC"])
+
+        events = self._read(where, params, order_by=order_by, limit=limit, offset=offset)
+        with self._lock:
+            total = self._conn.execute("SELECT COUNT(*) FROM events %s" % where, params).fetchone()[0]
+        return events, total
+
+    # the events with the given ids, in no particular order
+    def events_by_id(self, event_ids):
+        event_ids = [int(event_id) for event_id in event_ids]
+        if not event_ids:
+            return self._read("WHERE 0")
+        # in chunks, sqlite limits the number of parameters in a query
+        return pd.concat([self._read("WHERE id IN (%s)" % ", ".join("?" * len(chunk)), chunk, order_by="id")
+                          for chunk in (event_ids[i:i + 500] for i in range(0, len(event_ids), 500))],
+                         ignore_index=True)
+
+    # totals per day (freq "D") or per week starting on Monday (freq "W") for each event type and source, for the
+    # days start <= Day < end. Read from the rollups, so this costs the same no matter how many events there are.
+    def rollups(self, start=None, end=None, freq="D"):
+        if freq == "D":
+            period = "day"
+        elif freq == "W":
+            # 1970-01-01 was a Thursday
+            period = "day - (day + 3) % 7"
+        else:
+            raise ValueError("Unknown rollup frequency: %s" % freq)
+        conditions, params = [], []
+        if start is not None:
+            conditions.append("day >= ?")
+            params.append(to_epoch_minutes(pd.Timestamp(start).floor("D")) // minutes_per_day)
+        if end is not None:
+            conditions.append("day < ?")
+            params.append(to_epoch_minutes(pd.Timestamp(end).ceil("D")) // minutes_per_day)
+        query = 'SELECT %s AS "Day", event_type AS "Event Type", NULLIF(source, \'\') AS "Source", %s ' \
+                'FROM daily_rollups %s GROUP BY 1, 2, 3 ORDER BY 1, 2, 3' % (
+                    period, ", ".join('SUM(%s) AS "%s"' % (db_col, col) for col, db_col in rollup_columns.items()),
+                    "WHERE " + " AND ".join(conditions) if conditions else "")
+        with self._lock:
+            rollups = pd.read_sql_query(query, self._conn, params=params)
+        rollups["Day"] = pd.to_datetime(rollups["Day"], unit="D")
+        rollups["Event Type"] = pd.Categorical(rollups["Event Type"], categories=event_types)
+        rollups["Source"] = pd.Categorical(rollups["Source"], categories=food_sources)
+        rollups["Ounces"] = rollups["Ounces"].astype(float)
+        return rollups
+
+    # adds the rows (from validate_event) that aren't in the database yet, in one transaction, and returns
+    # (events added, duplicates skipped). An event is a duplicate of one with the same type, start, duration and
+    # source, whether that is already in the database or earlier in the rows.
+    def import_rows(self, rows):
+        rows = [[row.get(db_col) for db_col in event_columns.values()] for row in rows]
+
+        def run():
+            # only the events starting at the same minutes as the rows can be duplicates, looked up on the Start index
+            starts = sorted(set(row[1] for row in rows))
+            existing = set()
+            for i in range(0, len(starts), 500):
+                chunk = starts[i:i + 500]
+                existing.update(self._conn.execute(
+                    "SELECT event_type, start, duration_minutes, source FROM events WHERE start IN (%s)" %
+                    ", ".join("?" * len(chunk)), chunk))
+            totals = _new_rollup_totals()
+            added = []
+            for row in rows:
+                key = tuple(row[:4])
+                if key in existing:
+                    continue
+                existing.add(key)
+                cursor = self._conn.execute("INSERT INTO events (%s) VALUES (%s)" % (
+                    ", ".join(event_columns.values()), ", ".join("?" * len(event_columns))), row)
+                added_row = dict(zip(["id"] + list(event_columns.values()), [cursor.lastrowid] + row))
+                self._update_rollups(added_row, 1, totals)
+                added.append(self._row_to_event(added_row))
+            self._save_rollups(totals)
+            return (len(added), len(rows) - len(added)), added
+
+        imported, duplicates = self._write(run) if rows else (0, 0)
+        self._count_io(rows_written=imported)
+        return imported, duplicates
+
+    # every event with start <= Start < end, oldest first, as lists of up to chunk_size events. They are read through
+    # a connection of their own in one read transaction, so they are a consistent snapshot even while events are
+    # being added, and a slow reader (e.g. a download) doesn't hold up the rest of the app.
+    def iter_events(self, start=None, end=None, chunk_size=1000):
+        where, params = _range_conditions(start, end)
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.execute("BEGIN")
+            cursor = conn.execute("SELECT id, %s FROM events %s ORDER BY start, id" % (
+                ", ".join(event_columns.values()), where), params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                self._count_io(rows_read=len(rows))
+                yield [self._row_to_event(dict(zip(["id"] + list(event_columns.values()), row))) for row in rows]
+        finally:
+            conn.close()
+
+    def is_empty(self):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM events LIMIT 1").fetchone() is None
+
+    # one-shot import of the old Baby_Events.csv into an empty database, the csv is renamed afterwards so it is only
+    # imported once. Events that can't be imported are skipped and saved to Baby_Events.csv.rejected, a file that
+    # isn't an event file is logged and left alone. The file lock stops two app processes starting together from both
+    # importing it.
+    def migrate_csv(self, csv_path="Baby_Events.csv"):
+        with _file_lock(self.path):
+            if not os.path.exists(csv_path) or not self.is_empty():
+                return 0
+            # this runs when the app starts, a file that can't be imported is left where it is for the user to look at
+            # rather than stopping the app from starting
+            try:
+                # check the header before loading pandas to read the whole file
+                with open(csv_path, newline="") as csv_file:
+                    header = next(csv.reader(csv_file), [])
+                missing_columns = [column for column in legacy_csv_columns if column not in header]
+                if missing_columns:
+                    raise ValueError("it has no %s column" % missing_columns[0])
+                legacy_events = pd.read_csv(csv_path, dtype={"Start": str, "Duration": str, "Source": str,
+                                                             "Comment": str})
+                if len(legacy_events) == 0:
+                    raise ValueError("it has no events")
+            except (ValueError, csv.Error) as e:
+                logger.warning("%s was not imported, %s", csv_path, e)
+                return 0
+            rows, rejected = _legacy_events_to_rows(legacy_events)
+            rows = [row for line, row in rows]
+            _save_rejected_events(legacy_events, rejected, csv_path + ".rejected")
+
+            def run():
+                self._conn.executemany("INSERT INTO events (%s) VALUES (%s)" % (
+                    ", ".join(event_columns.values()), ", ".join("?" * len(event_columns))),
+                    [[row.get(db_col) for db_col in event_columns.values()] for row in rows])
+                self._rebuild_rollups()
+                # every event changed, listeners are passed None
+                return len(rows), None
+
+            imported = self._write(run)
+            self._count_io(rows_written=imported)
+            os.rename(csv_path, csv_path + ".migrated")
+        return imported
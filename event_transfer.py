@@ -0,0 +1,384 @@
+# Bulk import and export of events, e.g. to bring in the history from another tracker app or to make a backup.
+#
+#     python event_transfer.py import old_tracker.csv
+#     python event_transfer.py import old_tracker.json
+#     python event_transfer.py export backup.csv
+#     python event_transfer.py export 2021-07.parquet --start 2021-07-01 --end 2021-08-01
+#
+# Both work a chunk of events at a time, so they use the same memory no matter how long the history is. Imported
+# rows are checked one by one, rows that aren't valid events are skipped and reported, and events that are already in
+# the database are skipped. The same import and export are served by the app on /api/import and /api/export.
+import argparse
+import csv
+import io
+import json
+import re
+import sys
+from datetime import datetime
+from functools import lru_cache
+
+from event_store import (EventStore, event_time_formats, event_types, food_sources, format_duration, parse_duration,
+                         parse_event_time, validate_event)
+
+# events validated, checked for duplicates and added together in one transaction
+import_chunk_size = 1000
+# events read from the database and written out together, for Parquet files one row group each
+export_chunk_size = 5000
+# a json record longer than this is taken to be a broken file, rather than read into memory until the end of the file
+max_json_record_size = 2 ** 20
+# the most invalid rows listed in an import's report, the rest are only counted
+max_reported_errors = 20
+
+import_formats = ("csv", "json")
+export_formats = ("csv", "parquet")
+
+# the columns of an exported csv file, the same as the old Baby_Events.csv and the History table
+export_columns = ("Event Type", "Start", "Duration", "Source", "Ounces", "Comment")
+
+# other names for the event columns used by other tracker apps, compared in lower case without spaces or punctuation
+column_aliases = {
+    "eventtype": "Event Type", "type": "Event Type", "event": "Event Type", "activity": "Event Type",
+    "start": "Start", "starttime": "Start", "time": "Start", "date": "Start",
+    "end": "End", "endtime": "End",
+    "duration": "Duration", "durationminutes": "DurationMinutes", "minutes": "DurationMinutes",
+    "source": "Source", "side": "Source",
+    "ounces": "Ounces", "oz": "Ounces",
+    "comment": "Comment", "comments": "Comment", "note": "Comment", "notes": "Comment",
+}
+# other names for the event types, in lower case
+event_type_aliases = {"feed": "Food", "feeding": "Food", "nursing": "Food", "nap": "Sleep", "wet": "Pee",
+                      "dirty": "Poo"}
+# time formats of other apps and spreadsheets, tried after the app's own
+import_time_formats = ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S.%f",
+                       "%m/%d/%Y %I:%M %p", "%m/%d/%Y %H:%M", "%m/%d/%Y %I:%M:%S %p", "%m/%d/%Y %H:%M:%S")
+# durations written as a clock, e.g. 1:25 or 01:25:00
+clock_duration_pattern = re.compile(r"^\s*(?P<hours>\d+):(?P<minutes>\d{1,2})(?::(?P<seconds>\d{1,2}))?\s*$")
+
+
+# every record of a file has the same column names, so they are only worked out once
+@lru_cache(maxsize=256)
+def _column_key(name):
+    return re.sub(r"[^a-z]", "", str(name).lower())
+
+
+def _normalize_time(value):
+    if isinstance(value, datetime):
+        return value
+    text = str(value).strip()
+    try:
+        return parse_event_time(text)
+    except ValueError:
+        pass
+    # a UTC offset (e.g. +02:00 or Z) is dropped, the times are kept in the local time they were written in
+    text = re.sub(r"(Z|[+-]\d{2}:?\d{2})$", "", text)
+    for time_format in import_time_formats:
+        try:
+            return datetime.strptime(text, time_format)
+        except ValueError:
+            pass
+    raise ValueError("'%s' is not a valid time, use e.g. 2021-07-05 3:04 PM" % value)
+
+
+def _normalize_duration(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(round(value))
+    match = clock_duration_pattern.match(str(value))
+    if match is not None:
+        return int(match.group("hours")) * 60 + int(match.group("minutes")) + \
+               (1 if int(match.group("seconds") or 0) >= 30 else 0)
+    return parse_duration(str(value))
+
+
+def _normalize_choice(value, choices, aliases=None):
+    lookup = {choice.lower(): choice for choice in choices}
+    lookup.update(aliases or {})
+    return lookup.get(str(value).strip().lower(), value)
+
+
+# converts a record from an export (ours, the old Baby_Events.csv or another app's) to an event for validate_event
+def normalize_record(record):
+    event = {}
+    for name, value in record.items():
+        column = column_aliases.get(_column_key(name))
+        if column is not None and column not in event and value is not None and str(value).strip() != "":
+            event[column] = value
+    if "Event Type" in event:
+        event["Event Type"] = _normalize_choice(event["Event Type"], event_types, event_type_aliases)
+    if "Source" in event:
+        event["Source"] = _normalize_choice(event["Source"], food_sources)
+    if "Start" in event:
+        event["Start"] = _normalize_time(event["Start"])
+    if "DurationMinutes" in event:
+        event["DurationMinutes"] = _normalize_duration(event["DurationMinutes"])
+    elif "Duration" in event:
+        event["DurationMinutes"] = _normalize_duration(event["Duration"])
+    elif "End" in event and "Start" in event:
+        event["DurationMinutes"] = round((_normalize_time(event["End"]) - event["Start"]).total_seconds() / 60)
+    event.pop("Duration", None)
+    event.pop("End", None)
+    return event
+
+
+# the records of a csv file, as (row number, record), the header being row 1
+def _csv_records(text_stream):
+    reader = csv.DictReader(text_stream)
+    for record in reader:
+        yield reader.line_num, record
+
+
+# the records of a json file, either one array of objects or one object per line (JSON Lines), as
+# (record number, record), the record being the ValueError for a line that isn't valid json. An array is decoded a
+# piece at a time, so it doesn't have to fit in memory as text. A broken array raises ValueError, as the records after
+# the break can't be found.
+def _json_records(text_stream, read_size=65536):
+    decoder = json.JSONDecoder()
+    buffer = text_stream.read(read_size).lstrip("\ufeff")
+    position = len(buffer) - len(buffer.lstrip())
+    while position == len(buffer) and buffer:
+        buffer = text_stream.read(read_size)
+        position = len(buffer) - len(buffer.lstrip())
+    if not buffer[position:position + 1] == "[":
+        number = 0
+        for line in _chain_lines(buffer[position:], text_stream):
+            if line.strip():
+                number += 1
+                # a broken line is one invalid row, the rest of the file can still be read
+                try:
+                    yield number, json.loads(line)
+                except ValueError as e:
+                    yield number, e
+        return
+
+    position += 1
+    number = 0
+    end_of_file = False
+    while True:
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+        if position == len(buffer):
+            if end_of_file:
+                raise ValueError("the json array isn't closed with ]")
+            more = text_stream.read(read_size)
+            end_of_file = not more
+            buffer, position = buffer[position:] + more, 0
+            continue
+        if buffer[position] == "]":
+            return
+        try:
+            record, next_position = decoder.raw_decode(buffer, position)
+        except ValueError:
+            # the record goes on past the end of what has been read so far
+            more = text_stream.read(read_size)
+            if not more or len(buffer) - position > max_json_record_size:
+                raise
+            buffer, position = buffer[position:] + more, 0
+            continue
+        number += 1
+        yield number, record
+        position = next_position
+        if position > read_size:
+            buffer, position = buffer[position:], 0
+
+
+# the lines of text already read from a stream followed by the rest of its lines, the last line of the text may have
+# been cut off part way through
+def _chain_lines(text, rest):
+    lines = text.splitlines(True)
+    pending = lines.pop() if lines and not lines[-1].endswith("\n") else ""
+    for line in lines:
+        yield line
+    for line in rest:
+        if pending:
+            line, pending = pending + line, ""
+        yield line
+    if pending:
+        yield pending
+
+
+def read_records(text_stream, file_format):
+    if file_format == "csv":
+        return _csv_records(text_stream)
+    if file_format == "json":
+        return _json_records(text_stream)
+    raise ValueError("Unknown import format: %s, use one of: %s" % (file_format, ", ".join(import_formats)))
+
+
+# imports the events in a csv or json text stream, import_chunk_size events at a time. Returns how many events were
+# imported, how many were skipped as duplicates, how many rows weren't valid events, and the first
+# max_reported_errors of those as "row N: what is wrong". A file that breaks off part way (e.g. a json array with a
+# broken record) is imported up to the break, which is reported as the last invalid row.
+def import_events(event_store, text_stream, file_format):
+    report = {"imported": 0, "duplicates": 0, "invalid": 0, "errors": []}
+    rows = []
+
+    def add_rows():
+        imported, duplicates = event_store.import_rows(rows)
+        report["imported"] += imported
+        report["duplicates"] += duplicates
+        del rows[:]
+
+    records = read_records(text_stream, file_format)
+    number = 0
+    while True:
+        try:
+            number, record = next(records)
+        except StopIteration:
+            break
+        except (ValueError, csv.Error) as e:
+            report["invalid"] += 1
+            report["errors"].append("row %d: %s, the rest of the file could not be read" % (number + 1, e))
+            break
+        try:
+            if isinstance(record, ValueError):
+                raise record
+            if not isinstance(record, dict):
+                raise ValueError("not an event")
+            rows.append(validate_event(normalize_record(record)))
+        except (ValueError, TypeError) as e:
+            report["invalid"] += 1
+            if len(report["errors"]) < max_reported_errors:
+                report["errors"].append("row %d: %s" % (number, e))
+            continue
+        if len(rows) >= import_chunk_size:
+            add_rows()
+    if rows:
+        add_rows()
+    return report
+
+
+def _export_csv(event_store, start, end):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(export_columns)
+    for events in event_store.iter_events(start, end, export_chunk_size):
+        for event in events:
+            writer.writerow([event["Event Type"], event["Start"].strftime(event_time_formats[0]),
+                             format_duration(event["DurationMinutes"]), event["Source"] or "",
+                             "" if event["Ounces"] is None else event["Ounces"], event["Comment"] or ""])
+        yield output.getvalue()
+        output.seek(0)
+        output.truncate()
+    if output.tell():
+        yield output.getvalue()
+
+
+# collects what a ParquetWriter writes, so it can be passed on after every row group
+class _ChunkSink(io.RawIOBase):
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _export_parquet(event_store, start, end, pyarrow, parquet):
+    schema = pyarrow.schema([
+        ("Event Type", pyarrow.string()),
+        ("Start", pyarrow.timestamp("ms")),
+        ("DurationMinutes", pyarrow.int64()),
+        ("Source", pyarrow.string()),
+        ("Ounces", pyarrow.float64()),
+        ("Comment", pyarrow.string()),
+    ])
+    sink = _ChunkSink()
+    writer = parquet.ParquetWriter(sink, schema)
+    for events in event_store.iter_events(start, end, export_chunk_size):
+        writer.write_table(pyarrow.Table.from_pydict(
+            {column: [event[column] for event in events] for column in schema.names}, schema=schema))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+# the events with start <= Start < end in a csv or Parquet file, as a generator of the file's contents a chunk of
+# events at a time. Parquet needs pyarrow, which is checked for before anything is generated.
+def export_events(event_store, file_format, start=None, end=None):
+    if file_format == "csv":
+        return _export_csv(event_store, start, end)
+    if file_format == "parquet":
+        try:
+            import pyarrow
+            import pyarrow.parquet as parquet
+        except ImportError:
+            raise ValueError("Parquet export needs pyarrow, install it with: pip install pyarrow")
+        return _export_parquet(event_store, start, end, pyarrow, parquet)
+    raise ValueError("Unknown export format: %s, use one of: %s" % (file_format, ", ".join(export_formats)))
+
+
+# a start or end of the time range to export, either a day (2021-07-01) or a time
+def parse_range_bound(text):
+    if text is None or text == "":
+        return None
+    try:
+        return datetime.strptime(text.strip(), "%Y-%m-%d")
+    except ValueError:
+        return _normalize_time(text)
+
+
+def _format_from_path(path, formats, default):
+    extension = path.rsplit(".", 1)[-1].lower() if "." in path else ""
+    return extension if extension in formats else default
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import and export of events")
+    parser.add_argument("--db", default="Baby_Events.db")
+    commands = parser.add_subparsers(dest="command")
+    import_parser = commands.add_parser("import", help="add the events in a csv or json file")
+    import_parser.add_argument("path", help="the file to import, - for stdin")
+    import_parser.add_argument("--format", choices=import_formats, help="by default from the file extension")
+    export_parser = commands.add_parser("export", help="write the events to a csv or Parquet file")
+    export_parser.add_argument("path", help="the file to write, - for stdout")
+    export_parser.add_argument("--format", choices=export_formats, help="by default from the file extension")
+    export_parser.add_argument("--start", help="the first day (or time) to export, e.g. 2021-07-01")
+    export_parser.add_argument("--end", help="the day (or time) to export up to, not included")
+    args = parser.parse_args()
+    if args.command is None:
+        parser.error("choose import or export")
+
+    event_store = EventStore(args.db)
+    try:
+        if args.command == "import":
+            file_format = args.format or _format_from_path(args.path, import_formats, "csv")
+            if args.path == "-":
+                report = import_events(event_store, io.TextIOWrapper(sys.stdin.buffer, "utf-8-sig", newline=""),
+                                       file_format)
+            else:
+                with open(args.path, encoding="utf-8-sig", newline="") as text_stream:
+                    report = import_events(event_store, text_stream, file_format)
+            print("%d events imported, %d duplicates skipped, %d invalid rows skipped" % (
+                report["imported"], report["duplicates"], report["invalid"]))
+            for error in report["errors"]:
+                print("  " + error)
+        else:
+            file_format = args.format or _format_from_path(args.path, export_formats, "csv")
+            chunks = export_events(event_store, file_format, parse_range_bound(args.start),
+                                   parse_range_bound(args.end))
+            output = sys.stdout.buffer if args.path == "-" else open(args.path, "wb")
+            try:
+                for chunk in chunks:
+                    output.write(chunk.encode() if isinstance(chunk, str) else chunk)
+            finally:
+                if output is not sys.stdout.buffer:
+                    output.close()
+    except ValueError as e:
+        sys.exit(str(e))
+
+
+if __name__ == "__main__":
+    main()
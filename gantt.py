@@ -0,0 +1,142 @@
+import threading
+from datetime import timedelta
+
+from lazy_import import LazyModule
+
+np = LazyModule("numpy")
+pd = LazyModule("pandas")
+
+minutes_per_day = 24 * 60
+
+color_dict = {
+    "Poo": "#5e440b",
+    "Pee": "#fcfc11",
+    "Food": "#000991",
+    "Sleep": "#00913e",
+}
+
+
+def build_gantt_segments(baby_events):
+    # calculate when each event ended, events without a duration get a 10 minute block on the chart
+    minutes = baby_events["DurationMinutes"]
+    baby_events = baby_events.assign(**{
+        "Event Type": baby_events["Event Type"].astype(str),
+        "End": baby_events["Start"] + pd.to_timedelta(minutes.where(minutes > 0, 10), unit="m"),
+        "Duration": (minutes // 60).astype(str) + "h " + (minutes % 60).astype(str) + "m",
+    })
+
+    # break spillover events into two events, the first ends at 23:59 and the second starts at midnight
+    spillover = (baby_events["Start"].dt.normalize() != baby_events["End"].dt.normalize()).values
+    rows = np.repeat(np.arange(len(baby_events)), np.where(spillover, 2, 1))
+    second_part = np.zeros(len(rows), dtype=bool)
+    second_part[1:] = rows[1:] == rows[:-1]
+    first_part = spillover[rows] & ~second_part
+
+    gantt_events = baby_events.iloc[rows].copy()
+    # remember which event each segment came from, so segments can be put back in event order
+    gantt_events["Event_Start"] = gantt_events["Start"]
+    gantt_events["Event_Part"] = second_part.astype(int)
+    gantt_events.loc[first_part, "End"] = gantt_events["Start"][first_part].dt.normalize() + pd.Timedelta(hours=23,
+                                                                                                          minutes=59)
+    gantt_events.loc[second_part, "Start"] = gantt_events["End"][second_part].dt.normalize()
+
+    # calculate some other things for the gantt chart
+    gantt_events["Start_Date"] = gantt_events["Start"].dt.date
+    gantt_events["Start_Gantt_Time"] = gantt_events["Start"].dt.strftime('2000-01-01 %H:%M')
+    gantt_events["End_Gantt_Time"] = gantt_events["End"].dt.strftime('2000-01-01 %H:%M')
+    gantt_events["Gantt_Event_Type"] = gantt_events["Event Type"].replace({"Pee": "Potty", "Poo": "Potty"})
+    gantt_events["Gantt_Color"] = gantt_events["Event Type"].map(color_dict)
+    gantt_events["Gantt_Day"] = gantt_events["Start"].dt.strftime("%a, %b %-d")  # <br />
+
+    gantt_type = gantt_events["Gantt_Event_Type"]
+    bottle = (gantt_type == "Food") & (gantt_events["Source"] == "Bottle")
+    gantt_events["Details"] = np.select(
+        [gantt_type == "Potty", gantt_type == "Sleep", bottle],
+        ["" + gantt_events["Event Type"],
+         "Duration: " + gantt_events["Duration"],
+         "Source: " + gantt_events["Source"].astype(str) + "<br />Ounces: " + gantt_events["Ounces"].map(
+             "{:.1f}".format)],
+        default="Source: " + gantt_events["Source"].astype(str) + "<br />Duration: " + gantt_events["Duration"])
+
+    return gantt_events
+
+
+def _event_days(event):
+    # the calendar days an event could show up on in the gantt chart, every day from the day it started to the day it
+    # ended (an edited or mistyped event can be longer than a day)
+    start = event["Start"].date()
+    end = (event["Start"] + timedelta(minutes=event["DurationMinutes"] or 10)).date()
+    return [start + timedelta(days=n) for n in range((end - start).days + 1)]
+
+
+class GanttSegmentCache:
+    def __init__(self, event_store):
+        self.event_store = event_store
+        self._lock = threading.Lock()
+        # gantt segments keyed by calendar day, None for days without events
+        self._days = {}
+        # bumped on every invalidation, so a day built from data read before an edit is not cached after it
+        self._generation = 0
+        self._data_version = None
+        # the version of the change log the cache has caught up with
+        self._version = event_store.version()
+        event_store.add_listener(self.invalidate)
+
+    def invalidate(self, changed_events):
+        with self._lock:
+            self._generation += 1
+            if changed_events is None:
+                self._days.clear()
+                return
+            for event in changed_events:
+                for day in _event_days(event):
+                    self._days.pop(day, None)
+
+    def _days_segments(self, days):
+        # writes from other processes are found in the change log, and only clear the days they touched
+        data_version = self.event_store.data_version()[0]
+        if data_version != self._data_version:
+            version, changes = self.event_store.changes(self._version)
+            self.invalidate(None if changes is None else
+                            [event for change in changes for event in (change["Old"], change["New"]) if event])
+            with self._lock:
+                self._version = version
+                self._data_version = data_version
+        with self._lock:
+            missing_days = [day for day in days if day not in self._days]
+            generation = self._generation
+            segments = {day: self._days[day] for day in days if day in self._days}
+
+        if missing_days:
+            # events from the days before can run into the first missing day, as far back as the longest event reaches
+            days_back = self.event_store.max_duration() // minutes_per_day + 1
+            events = self.event_store.range(start=min(missing_days) - timedelta(days=days_back),
+                                            end=max(missing_days) + timedelta(days=1))[::-1]
+            built_days = dict(tuple(build_gantt_segments(events).groupby("Start_Date", sort=False))) \
+                if len(events) else {}
+            new_segments = {day: built_days.get(day) for day in missing_days}
+            segments.update(new_segments)
+            with self._lock:
+                if generation == self._generation:
+                    self._days.update(new_segments)
+
+        return segments
+
+    # gantt segments of the last n + 1 days with events, in the same order build_gantt_segments would return them
+    def segments(self, n_days_back=7):
+        last_event = self.event_store.last_n(1)
+        if len(last_event) == 0:
+            return build_gantt_segments(last_event)
+        last_day = last_event["Start"][0].date()
+        # the last events may run into the next days, the chart ends with the last day anything shows up on
+        later_days = [last_day + timedelta(days=n)
+                      for n in range(1, self.event_store.max_duration() // minutes_per_day + 2)]
+        later_segments = self._days_segments(later_days)
+        last_day = max([day for day in later_days if later_segments[day] is not None], default=last_day)
+
+        days = [last_day - timedelta(days=n) for n in range(n_days_back + 1)]
+        segments = [day_segments for day_segments in self._days_segments(days).values() if day_segments is not None]
+        if not segments:
+            return build_gantt_segments(last_event.iloc[0:0])
+        return pd.concat(segments).sort_values(["Event_Start", "id", "Event_Part"], ascending=[False, False, True],
+                                               kind="mergesort")
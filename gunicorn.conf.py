@@ -0,0 +1,21 @@
+import os
+
+bind = "0.0.0.0:8050"
+
+# one slow callback (like building the Analytics tab) only blocks its own worker thread, the other workers and
+# threads keep answering the other phones. Each worker loads its own copy of pandas and plotly, so keep the number
+# of workers low on a Raspberry Pi with 1GB of memory.
+workers = int(os.environ.get("BABY_TRACKER_WORKERS", 2))
+threads = int(os.environ.get("BABY_TRACKER_THREADS", 4))
+
+# the app must be loaded in each worker, not once before forking. Each worker needs its own SQLite connection and
+# its own event store writer thread, neither of which survive a fork.
+preload_app = False
+
+timeout = 60
+
+
+# build the caches in the background once a worker has loaded the app, see main.prewarm
+def post_worker_init(worker):
+    from main import prewarm
+    prewarm()
@@ -0,0 +1,27 @@
+import importlib
+import os
+import threading
+
+# set BABY_TRACKER_EAGER_IMPORTS=1 to import everything up front, e.g. to compare start up times
+eager_imports = os.environ.get("BABY_TRACKER_EAGER_IMPORTS", "") not in ("", "0")
+
+
+# a stand in for a module that is only imported the first time one of its attributes is used, so the heavy analytics
+# libraries (pandas, numpy, plotly) don't hold up starting the app, e.g. after a power cut
+class LazyModule:
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+        if eager_imports:
+            self._load()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
@@ -0,0 +1,144 @@
+# Measures how many requests per second the app answers with different numbers of gunicorn workers.
+#
+#     python load_test.py --workers 1 2 4 --clients 8 --seconds 20
+#
+# For each worker count a gunicorn server is started on a copy of Baby_Events.db, then --clients threads load the
+# chosen tab over and over for --seconds seconds, sending the requests a browser sends when the tab is opened. For the
+# Analytics tab (the default, the slowest one) that is the tab's layout and then the Analytics and Patterns figures,
+# each timed as a request of its own. The figures are sent in full every time, as to a page that hasn't got them yet,
+# but they come from the app's cache of the latest builds, so this measures serving them: benchmark.py times building
+# them.
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+project_dir = os.path.dirname(os.path.abspath(__file__))
+
+# the ids of main.py's input stores, copied here so the load test doesn't have to import the app
+store_id_prefix = ('start-feed-time', 'end-feed-time', 'food-source', 'ounces', 'feed-comment-text', 'potty-time',
+                   'potty-type', 'potty-comment-text', 'start-sleep-time', 'end-sleep-time', 'sleep-comment-text')
+
+
+def dash_request(port, outputs, inputs, state=()):
+    body = json.dumps({
+        "output": ".." + "...".join("%s.%s" % output for output in outputs) + ".." if len(outputs) > 1
+        else "%s.%s" % outputs[0],
+        "outputs": [{"id": id, "property": property} for id, property in outputs] if len(outputs) > 1
+        else {"id": outputs[0][0], "property": outputs[0][1]},
+        "inputs": [{"id": id, "property": property, "value": value} for id, property, value in inputs],
+        "state": [{"id": id, "property": property, "value": value} for id, property, value in state],
+        "changedPropIds": ["%s.%s" % inputs[0][:2]],
+    }).encode()
+    return urllib.request.Request("http://127.0.0.1:%d/_dash-update-component" % port, data=body,
+                                  headers={"Content-Type": "application/json"})
+
+
+def render_tab_request(port, tab):
+    # the Input tab's stored inputs, all empty
+    return dash_request(port, [("tab-content", "children")], [("tabs", "value", tab)],
+                        [("%s-store" % name, "data", {"value": ""}) for name in store_id_prefix])
+
+
+# the requests for the Analytics figures (update_analytics_figures) and the Patterns figure (update_patterns_figure) of
+# a page that has none of them yet, with the days shown when the tab is opened
+def figure_requests(port):
+    return [
+        dash_request(port, [("gantt-figure", "data"), ("gantt-figure-key", "data"), ("trends-figure", "data"),
+                            ("trends-figure-key", "data")],
+                     [("gantt-days", "value", 7), ("data-version", "data", None)],
+                     [("gantt-figure-key", "data", None), ("trends-figure-key", "data", None)]),
+        dash_request(port, [("patterns-figure", "data"), ("patterns-figure-key", "data")],
+                     [("patterns-days", "value", 90), ("data-version", "data", None)],
+                     [("patterns-figure-key", "data", None)]),
+    ]
+
+
+# the requests a browser sends when the tab is opened
+def tab_requests(port, tab):
+    return [render_tab_request(port, tab)] + (figure_requests(port) if tab == "visuals" else [])
+
+
+def wait_until_up(port, timeout=60):
+    give_up = time.time() + timeout
+    while time.time() < give_up:
+        try:
+            urllib.request.urlopen("http://127.0.0.1:%d/" % port, timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError("the server did not start within %d seconds" % timeout)
+
+
+def run_clients(port, tab, clients, seconds):
+    latencies, errors = [], []
+    stop_at = time.time() + seconds
+
+    def client():
+        while time.time() < stop_at:
+            for request in tab_requests(port, tab):
+                started = time.time()
+                try:
+                    urllib.request.urlopen(request, timeout=60).read()
+                    latencies.append(time.time() - started)
+                except OSError as e:
+                    errors.append(e)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--tab", default="visuals", choices=["event-input", "tables", "visuals"])
+    parser.add_argument("--db", default=os.path.join(project_dir, "Baby_Events.db"))
+    parser.add_argument("--port", type=int, default=8150)
+    args = parser.parse_args()
+
+    print("workers  requests/s  median ms  p95 ms  errors")
+    for workers in args.workers:
+        # run against a copy of the data, so the test never touches the real events
+        run_dir = tempfile.mkdtemp()
+        if os.path.exists(args.db):
+            # the backup API also copies anything still in the write ahead log
+            with sqlite3.connect(args.db) as source, sqlite3.connect(os.path.join(run_dir, "Baby_Events.db")) as copy:
+                source.backup(copy)
+        server = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "--chdir", run_dir, "--pythonpath", project_dir,
+             "-c", os.path.join(project_dir, "gunicorn.conf.py"), "--bind", "127.0.0.1:%d" % args.port,
+             "--workers", str(workers), "--threads", str(args.threads), "wsgi:server"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_up(args.port)
+            # warm up every worker before measuring
+            run_clients(args.port, args.tab, workers, 2)
+            latencies, errors = run_clients(args.port, args.tab, args.clients, args.seconds)
+        finally:
+            server.terminate()
+            server.wait()
+            shutil.rmtree(run_dir)
+
+        latencies.sort()
+        print("%7d  %10.1f  %9.0f  %6.0f  %6d" % (
+            workers, len(latencies) / args.seconds,
+            1000 * latencies[len(latencies) // 2] if latencies else float("nan"),
+            1000 * latencies[int(len(latencies) * 0.95)] if latencies else float("nan"), len(errors)))
+
+
+if __name__ == "__main__":
+    main()
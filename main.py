@@ -2,20 +2,38 @@ import dash
 import dash_html_components as html
 import dash_core_components as dcc
 import dash_table
-from dash.dependencies import Input, Output, State
+import codecs
+from dash.dependencies import Input, Output, State, ClientsideFunction
 from dash.exceptions import PreventUpdate
-import plotly.figure_factory as ff
-from datetime import datetime
-import pandas as pd
-from math import floor
+from flask import jsonify, request, stream_with_context
+from flask_compress import Compress
+from datetime import datetime, timedelta
+import re
+import json
+import os
+import threading
+import time
+from math import ceil
 from collections import OrderedDict
+from event_store import EventStore, format_duration, parse_duration, parse_event_time
+from event_transfer import export_events, import_events, import_formats, parse_range_bound
+from gantt import GanttSegmentCache, color_dict
+from patterns import activity_patterns
+from lazy_import import LazyModule
+from metrics import instrument_app
+from response_cache import VersionedCache
 
-# check if tracker file exists, if not, create it
-try:
-    events = pd.read_csv("Baby_Events.csv")
-except IOError as e:
-    pd.DataFrame(columns=["Event Type", "Start", "Duration", "Source", "Ounces", "Comment"]).to_csv("Baby_Events.csv",
-                                                                                                    index=False)
+# only imported when the History or Analytics tab is first opened (or by prewarm), see lazy_import
+go = LazyModule("plotly.graph_objects")
+pd = LazyModule("pandas")
+plotly_subplots = LazyModule("plotly.subplots")
+
+# open the event database, importing the old csv tracker file the first time
+event_store = EventStore("Baby_Events.db")
+event_store.migrate_csv("Baby_Events.csv")
+gantt_segment_cache = GanttSegmentCache(event_store)
+# figures and table pages, rebuilt in the background after every change
+response_cache = VersionedCache(event_store)
 
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
@@ -29,16 +47,38 @@ now_botton_style = {
     'color': 'black',
 }
 
-color_dict = {
-    "Poo": "#5e440b",
-    "Pee": "#fcfc11",
-    "Food": "#000991",
-    "Sleep": "#00913e",
-}
+# the columns of the History table, Duration is shown as e.g. "1h 25m" instead of in minutes
+table_columns = ["Event Type", "Start", "Duration", "Source", "Ounces", "Comment"]
 
-# the number of rows (events) to display on the table
+# the number of rows (events) to display on each page of the table
 events_to_display = 200
 
+# the number of days shown in the Analytics trend charts
+trend_days = 60
+
+# the number of days shown by default in the Analytics pattern heatmaps (12 months are a much bigger download, so they
+# are only sent when picked), and the minutes in each of their rows
+pattern_days = 90
+pattern_bucket_minutes = 30
+
+# the number of days an Analytics figure shows when /api/figures isn't asked for a number
+figure_default_days = {"gantt": 7, "trends": trend_days, "patterns": pattern_days}
+
+# how often (in milliseconds) the status panel on the Input tab updates its "... ago" times
+status_refresh_interval = 60 * 1000
+
+# how often (in milliseconds) open pages check the data version, so events added on another device show up
+live_update_interval = 2000
+
+# filter operators of the DataTable's filter_query and the matching event_store operators
+filter_operators = OrderedDict([
+    ('ge', '>='), ('>=', '>='), ('le', '<='), ('<=', '<='), ('lt', '<'), ('<', '<'), ('gt', '>'), ('>', '>'),
+    ('ne', '!='), ('!=', '!='), ('eq', '='), ('=', '='), ('contains', 'contains'),
+    ('datestartswith', 'datestartswith'),
+])
+filter_part_pattern = re.compile(r"^\s*\{(?P<column>[^}]+)\}\s*(?P<operator>%s)\s*(?P<value>.*?)\s*$" % "|".join(
+    re.escape(operator) for operator in filter_operators))
+
 store_id_prefix = ('start-feed-time', 'end-feed-time', 'food-source', 'ounces', 'feed-comment-text', 'potty-time',
                    'potty-type', 'potty-comment-text', 'start-sleep-time', 'end-sleep-time', 'sleep-comment-text')
 
@@ -51,7 +91,15 @@ app = dash.Dash(
     external_stylesheets=external_stylesheets,
     meta_tags=[
         {"name": "viewport", "content": "width=device-width, initial-scale=1"}
-    ])
+    ],
+    compress=False)
+# compress responses with brotli where the browser supports it (Dash itself would only use gzip), and gzip otherwise
+app.server.config["COMPRESS_ALGORITHM"] = ["br", "gzip"]
+# streamed responses (the exports) are sent as they are, Flask-Compress would read the whole stream into memory first
+app.server.config["COMPRESS_STREAMS"] = False
+Compress(app.server)
+# time every callback from here on, see /metrics
+metrics = instrument_app(app, event_store)
 
 app.layout = html.Div([
     dcc.Tabs(id='tabs', value='event-input', children=[
@@ -60,85 +108,88 @@ app.layout = html.Div([
         dcc.Tab(label='Analytics', value='visuals'),
     ]),
     html.Div(id='tab-content'),
-    # create store objects to store event inputs
-    html.Div([dcc.Store(id='%s-store' % name, data={"value": ""}) for name in store_id_prefix]),
-    # , storage_type='session',
-    dcc.Location(id="hidden-page-refresh1", refresh=True),
-    dcc.Location(id="hidden-page-refresh2", refresh=True),
-    dcc.Location(id="hidden-page-refresh3", refresh=True)
+    # create store objects to store event inputs, kept in the browser's session storage
+    html.Div([dcc.Store(id='%s-store' % name, data={"value": ""}, storage_type='session') for name in store_id_prefix]),
+    # the id of the last submitted event of each form, used to reset the form in place
+    dcc.Store(id='feed-submitted'),
+    dcc.Store(id='potty-submitted'),
+    dcc.Store(id='sleep-submitted'),
+    # the data version the open History or Analytics view was last updated to
+    dcc.Store(id='data-version'),
+    # the Analytics figures last sent to this page and the cache keys they were built for, so switching back to the
+    # Analytics tab shows them straight from the browser and only a changed figure is sent again
+    dcc.Store(id='gantt-figure'),
+    dcc.Store(id='gantt-figure-key'),
+    dcc.Store(id='trends-figure'),
+    dcc.Store(id='trends-figure-key'),
+    dcc.Store(id='patterns-figure'),
+    dcc.Store(id='patterns-figure-key'),
+    dcc.Interval(id='live-updates', interval=live_update_interval)
 ])
 
 
+def events_to_table_data(events):
+    # the row "id" is used by the DataTable as the row id and is not shown as a column
+    events = events.assign(
+        Start=events["Start"].dt.strftime("%Y-%m-%-d %-I:%M %p"),
+        Duration=[None if (event_type in ("Pee", "Poo")) & (minutes == 0) else format_duration(minutes)
+                  for event_type, minutes in zip(events["Event Type"], events["DurationMinutes"])],
+    )[["id"] + table_columns]
+    return events.astype(object).where(events.notna(), None).to_dict("records")
+
+
+# converts edited History table cells to event fields
+def table_changes_to_event(changes):
+    changes = dict(changes)
+    if "Duration" in changes:
+        changes["DurationMinutes"] = parse_duration(changes.pop("Duration"))
+    return changes
+
+
+def saved_message(event):
+    # confirmation shown under a form once its event is saved
+    return "Saved %s at %s" % (event["Event Type"], event["Start"].strftime("%Y-%m-%-d %-I:%M %p"))
+
+
 def calc_duration(start, end):
-    st = datetime.strptime(start, "%Y-%m-%d %I:%M %p")
-    nd = datetime.strptime(end, "%Y-%m-%d %I:%M %p")
-    duration = (nd - st)
-    return "%dh %dm" % (floor(duration.total_seconds() / 3600), floor((duration.seconds % 3600) / 60))
+    # the length of an event in whole minutes
+    return (parse_event_time(end) - parse_event_time(start)) // timedelta(minutes=1)
 
 
 def create_gantt_fig(n_days_back=7):
-    # import event data
-    baby_events = pd.read_csv("Baby_Events.csv", parse_dates=[1], infer_datetime_format=True)[::-1]
-    baby_events["Duration"] = baby_events["Duration"].fillna("0h 0m")
-
-    # Only the last n + 1 days to cut down on time
-    baby_events = baby_events[
-        baby_events["Start"] >= pd.Timestamp(baby_events["Start"].max().date() - pd.Timedelta(days=n_days_back + 1))]
-
-    # break spillover events into two events
-    gantt_events = pd.DataFrame()
-    for ind, event in baby_events.iterrows():
-        if event["Duration"] != "0h 0m":
-            event["End"] = event["Start"] + pd.Timedelta(hours=int(event["Duration"].split()[0][:-1]),
-                                                         minutes=int(event["Duration"].split()[-1][:-1]))
-        else:
-            event["End"] = event["Start"] + pd.Timedelta(minutes=10)
-
-        # check if the event spills over from one day to another
-        if event["Start"].date() != event["End"].date():
-            first_event, second_event = event.copy(), event.copy()
-            first_event["End"] = pd.to_datetime(str(event["Start"].date()) + " 23:59")
-            second_event["Start"] = pd.to_datetime(str(event["End"].date()) + " 00:00")
-            gantt_event = pd.concat([first_event, second_event], axis=1, ignore_index=True).T
-        else:
-            gantt_event = event.to_frame().T
-
-        # calculate some other things for the gantt chart
-        gantt_event["Start_Date"] = [t.date() for t in gantt_event["Start"]]
-        gantt_event["Start_Gantt_Time"] = [t.strftime('2000-01-01 %H:%M') for t in gantt_event["Start"]]
-        gantt_event["End_Gantt_Time"] = [t.strftime('2000-01-01 %H:%M') for t in gantt_event["End"]]
-        gantt_event["Gantt_Event_Type"] = ["Potty" if event in ["Pee", "Poo"] else event for event in
-                                           gantt_event["Event Type"]]
-        gantt_event["Gantt_Color"] = [color_dict[event] for event in gantt_event["Event Type"]]
-        gantt_event["Gantt_Day"] = [event.strftime("%a, %b %-d") for event in gantt_event["Start_Date"]]  # <br />
-
-        gantt_event["Details"] = [gantt_event["Event Type"] if g_event["Gantt_Event_Type"] == "Potty"
-                                  else "Duration: %s" % g_event["Duration"] if g_event["Gantt_Event_Type"] == "Sleep"
-        else "Source: %s<br />Ounces: %.1f" % (g_event["Source"], g_event["Ounces"]) if (g_event[
-                                                                                             "Gantt_Event_Type"] == "Food") & (
-                                                                                                g_event[
-                                                                                                    "Source"] == "Bottle")
-        else "Source: %s<br />Duration: %s" % (g_event["Source"], g_event["Duration"]) for ind, g_event in
-                                  gantt_event.iterrows()]
-
-        # add the event(s) to a new DF
-        gantt_events = pd.concat([gantt_events, gantt_event])
-
-    # Only the last n days
-    gantt_events = gantt_events[gantt_events["Start"] >= pd.Timestamp(gantt_events["Start"].max().date() - pd.Timedelta(days=n_days_back))]
-
-
-    gantt_data = gantt_events.copy().drop("Start", axis=1).rename(
-        columns={"Gantt_Day": "Task", "Start_Gantt_Time": "Start", "End_Gantt_Time": "Finish"})
-
-    gantt = ff.create_gantt(gantt_data, colors=color_dict, index_col='Event Type', reverse_colors=False,
-                            show_colorbar=True, group_tasks=True)
-
-    gantt.layout.title = None
-    gantt.layout.xaxis.rangeselector = None
+    # gantt segments of the last n days, only the days that changed since the last call are rebuilt
+    gantt_events = gantt_segment_cache.segments(n_days_back)
+
+    # one row per day, oldest at the bottom, and one horizontal bar trace per event type: each bar starts at its
+    # time of day (base) and is as long as the segment (in milliseconds, as the x axis is a date axis)
+    gantt_days = gantt_events[["Start_Date", "Gantt_Day"]].drop_duplicates().sort_values("Start_Date")
+    day_rows = pd.Series(range(len(gantt_days)), index=gantt_days["Start_Date"].values, dtype="int64")
+    bar_starts = pd.to_datetime(gantt_events["Start_Gantt_Time"])
+    bar_lengths = (pd.to_datetime(gantt_events["End_Gantt_Time"]) - bar_starts) // pd.Timedelta(milliseconds=1)
+
+    gantt = go.Figure()
+    for event_type in ("Sleep", "Food", "Pee", "Poo"):
+        is_type = (gantt_events["Event Type"] == event_type).values
+        if not is_type.any():
+            continue
+        gantt.add_trace(go.Bar(
+            name=event_type,
+            orientation='h',
+            y=day_rows[gantt_events["Start_Date"].values[is_type]].values,
+            base=bar_starts[is_type].dt.strftime("%Y-%m-%d %H:%M").values,
+            x=bar_lengths[is_type].values,
+            width=0.8,
+            marker=dict(color=color_dict[event_type], line=dict(width=0)),
+            customdata=gantt_events["Details"].values[is_type],
+            hovertemplate="%{customdata}<extra>" + event_type + "</extra>",
+        ))
 
     gantt.update_layout(
-        yaxis=dict(title=None),
+        barmode='overlay',
+        hovermode='closest',
+        height=max(600, 150 + 25 * len(gantt_days)),
+        yaxis=dict(title=None, tickvals=list(range(len(gantt_days))), ticktext=list(gantt_days["Gantt_Day"]),
+                   range=[-1, len(gantt_days) + 1], showgrid=False, zeroline=False),
         xaxis=dict(range=['2000-01-01 00:00', '2000-01-02 00:00'],
                    rangeslider=dict(visible=True),
                    rangeselector=dict(
@@ -157,6 +208,8 @@ def create_gantt_fig(n_days_back=7):
                                 stepmode="backward"),
                        ])
                    ),
+                   showgrid=False,
+                   zeroline=False,
                    type="date"),
         showlegend=True,
         legend=dict(orientation='h', xanchor="right", x=1, yanchor="bottom", y=1),
@@ -167,11 +220,162 @@ def create_gantt_fig(n_days_back=7):
     return gantt
 
 
+# the day after the last event, the Analytics panels show the days up to it
+def analytics_end_day():
+    last_event = event_store.last_n(1)
+    last_day = last_event["Start"][0] if len(last_event) else pd.Timestamp.now()
+    return last_day.floor("D") + pd.Timedelta(days=1)
+
+
+# daily totals of one column for one event type, with 0 for the days without any
+def daily_totals(rollups, column, event_type, days):
+    return rollups[rollups["Event Type"] == event_type].groupby("Day")[column].sum().reindex(days, fill_value=0)
+
+
+def create_trends_fig(n_days_back=trend_days):
+    # daily and weekly totals come from the rollups, so this doesn't read any events
+    end_day = analytics_end_day()
+    days = pd.date_range(end=end_day - pd.Timedelta(days=1), periods=n_days_back, freq="D")
+    daily = event_store.rollups(start=days[0], end=end_day)
+    first_week = days[0] - pd.Timedelta(days=days[0].weekday())
+    weekly = event_store.rollups(start=first_week, end=end_day, freq="W")
+    weeks = pd.date_range(start=first_week, end=days[-1], freq="7D")
+
+    trends = plotly_subplots.make_subplots(rows=4, cols=1, shared_xaxes=True, vertical_spacing=0.06, subplot_titles=(
+        "Sleep (hours per day)", "Feeds per day", "Ounces per day", "Poos per week"))
+    for row, (name, values, color) in enumerate((
+            ("Sleep", daily_totals(daily, "DurationMinutes", "Sleep", days) / 60, color_dict["Sleep"]),
+            ("Feeds", daily_totals(daily, "Events", "Food", days), color_dict["Food"]),
+            ("Ounces", daily_totals(daily, "Ounces", "Food", days), color_dict["Food"])), start=1):
+        trends.add_trace(go.Scatter(x=values.index, y=values.values, name=name, mode="lines+markers",
+                                    line=dict(color=color)), row=row, col=1)
+        # a 7 day average to show the trend through the day to day noise
+        trends.add_trace(go.Scatter(x=values.index, y=values.rolling(7, min_periods=1).mean().values,
+                                    name="%s (7 day average)" % name, mode="lines",
+                                    line=dict(color=color, dash="dot")), row=row, col=1)
+    poos = daily_totals(weekly, "Events", "Poo", weeks)
+    trends.add_trace(go.Bar(x=poos.index, y=poos.values, name="Poos", marker=dict(color=color_dict["Poo"])),
+                     row=4, col=1)
+
+    trends.update_layout(
+        height=900,
+        showlegend=False,
+        margin={'r': 0, 'l': 0},
+        xaxis4_tickformat='%b %-d'
+    )
+    return trends
+
+
+def create_averages(n_days_back=7):
+    # averages over the last n days, from the rollups
+    end_day = analytics_end_day()
+    daily = event_store.rollups(start=end_day - pd.Timedelta(days=n_days_back), end=end_day)
+    sleeps = daily[daily["Event Type"] == "Sleep"]
+    wake_windows = sleeps["WakeWindows"].sum()
+    averages = [
+        ("Sleep per day", format_duration(round(sleeps["DurationMinutes"].sum() / n_days_back))),
+        ("Feeds per day", "%.1f" % (daily[daily["Event Type"] == "Food"]["Events"].sum() / n_days_back)),
+        ("Ounces per day", "%.1f" % (daily[daily["Event Type"] == "Food"]["Ounces"].sum() / n_days_back)),
+        ("Poos per day", "%.1f" % (daily[daily["Event Type"] == "Poo"]["Events"].sum() / n_days_back)),
+        ("Average wake window",
+         format_duration(round(sleeps["WakeMinutes"].sum() / wake_windows)) if wake_windows else "-"),
+    ]
+    return [
+        html.H6('Last %d days' % n_days_back, style={"font-size": "18px"}),
+        html.Table([html.Tr([html.Td(label), html.Td(value)]) for label, value in averages])
+    ]
+
+
+# the time of day heatmaps over months of events, binned with array operations (see patterns.py) instead of the
+# row by row gantt pipeline
+def create_patterns_fig(n_days_back=pattern_days):
+    end_day = analytics_end_day()
+    first_day = end_day - pd.Timedelta(days=n_days_back)
+    events = event_store.range(start=first_day - pd.Timedelta(days=1), end=end_day)
+    patterns = activity_patterns(events, first_day, n_days_back, pattern_bucket_minutes)
+    days = pd.date_range(start=first_day, periods=n_days_back, freq="D")
+    times = [(pd.Timestamp("2000-01-01") + pd.Timedelta(minutes=minute)).strftime("%-I:%M %p")
+             for minute in range(0, 24 * 60, pattern_bucket_minutes)]
+
+    figure = plotly_subplots.make_subplots(
+        rows=5, cols=1, shared_xaxes=True, vertical_spacing=0.04, row_heights=[0.25, 0.25, 0.25, 0.125, 0.125],
+        subplot_titles=("Asleep", "Feeding", "Pees and poos", "Sleep (hours per day, 7 day average)",
+                        "Time between feeds (hours, 7 day average)"))
+    for row, (name, color, unit) in enumerate((
+            ("Asleep", color_dict["Sleep"], "minutes asleep"),
+            ("Feeding", color_dict["Food"], "minutes feeding"),
+            ("Potty", color_dict["Poo"], "pees and poos")), start=1):
+        # one column per day and one row per time of day, the night at the top
+        figure.add_trace(go.Heatmap(
+            x=days, y=times, z=patterns[name].T, zmin=0, colorscale=[[0, "white"], [1, color]], showscale=False,
+            hovertemplate="%{x|%b %-d} %{y}: %{z} " + unit + "<extra></extra>"), row=row, col=1)
+        figure.update_yaxes(autorange="reversed", nticks=8, row=row, col=1)
+    for row, (name, color) in enumerate((("Sleep hours", color_dict["Sleep"]),
+                                         ("Feed interval hours", color_dict["Food"])), start=4):
+        figure.add_trace(go.Scatter(x=days, y=patterns[name].round(2), name=name, mode="lines",
+                                    line=dict(color=color)), row=row, col=1)
+
+    figure.update_layout(
+        height=1200,
+        showlegend=False,
+        margin={'r': 0, 'l': 0},
+        xaxis5_tickformat='%b %-d'
+    )
+    return figure
+
+
+figure_builders = {"gantt": create_gantt_fig, "trends": create_trends_fig, "patterns": create_patterns_fig}
+
+
+# the key (which changes with the data version it was built from) and JSON of an Analytics figure showing
+# n_days_back days, at least as new as min_version, see VersionedCache
+def figure_json(name, n_days_back, min_version=None):
+    return response_cache.get(name, (n_days_back,), lambda: figure_builders[name](n_days_back).to_json(), min_version)
+
+
+# one page of the History table and the number of events matching the filters, see VersionedCache
+def table_page(offset, limit, sort_by=(), filters=(), min_version=None):
+    def build():
+        events, total_events = event_store.page(offset, limit, sort_by, filters)
+        return events_to_table_data(events), total_events
+
+    return response_cache.get("table", (offset, limit, tuple(sort_by), tuple(filters)), build, min_version)[1]
+
+
+def time_since(time, now):
+    if time > now:
+        return "in %s" % format_duration((time - now) // timedelta(minutes=1))
+    return "%s ago" % format_duration((now - time) // timedelta(minutes=1))
+
+
+def create_status():
+    # answers "how long since the last nap / feed" from the last event of each type, without reading any history
+    now = datetime.now()
+    last_events = event_store.last_events()
+    last_type, last_source = last_events["Event Type"], last_events["Source"]
+    last_feed, last_sleep = last_type["Food"], last_type["Sleep"]
+    status = [
+        ("Last feed", "-" if last_feed is None else "%s (%s)" % (
+            time_since(last_feed["Start"], now), last_feed["Source"] or "no source")),
+        ("Breast", " / ".join("%s %s" % (source, "-" if last_source[source] is None
+                                         else time_since(last_source[source]["Start"], now))
+                              for source in ("Left", "Right"))),
+        ("Awake since", "-" if last_sleep is None else "still asleep" if last_sleep["End"] > now
+         else time_since(last_sleep["End"], now)),
+        ("Last pee", "-" if last_type["Pee"] is None else time_since(last_type["Pee"]["Start"], now)),
+        ("Last poo", "-" if last_type["Poo"] is None else time_since(last_type["Poo"]["Start"], now)),
+    ]
+    return html.Table([html.Tr([html.Td(label), html.Td(value)]) for label, value in status])
+
+
 @app.callback(Output('tab-content', 'children'),
-              Input('tabs', 'value'))
-def render_content(tab):
+              Input('tabs', 'value'),
+              *[State('%s-store' % name, 'data') for name in store_id_prefix])
+def render_content(tab, *stored_inputs):
     if tab == 'event-input':
         return html.Div([
+            html.Div(create_status(), id='event-status'),
+            dcc.Interval(id='status-refresh', interval=status_refresh_interval),
             html.H5('Event Input', style={"font-size": "20px", "text-decoration": "underline"}),
             # Buttons to select what kind of event
             dcc.RadioItems(
@@ -184,50 +388,67 @@ def render_content(tab):
                 value='Food',
                 labelStyle={'display': 'inline-block'}
             ),
-            # Add a generic Div which will be updates with input fields based on the event type
-            html.Div(id='input-fields'),
+            # Add the input fields for every event type, only the ones for the selected event type are shown
+            html.Div(id='input-fields', children=[
+                html.Div(display_available_inputs(event_type, *stored_inputs), id='%s-inputs' % event_type.lower(),
+                         style={'display': 'block' if event_type == 'Food' else 'none'})
+                for event_type in ('Food', 'Potty', 'Sleep')
+            ]),
             # placeholder for testing
             html.P(id='placeholder'),
             html.P(id='placeholder2'),
             html.P(id='placeholder3'),
         ])
     elif tab == 'tables':
-        ## import csv and prep it for viewing
-        events = pd.read_csv("Baby_Events.csv")[::-1].iloc[0:events_to_display]
+        ## import the first page of events and prep them for viewing, other pages are served by update_table_page
+        rows, total_events = table_page(0, events_to_display)
         return html.Div([
-            html.H3('Last %d events' % events_to_display),
+            html.H3('Event history'),
             dash_table.DataTable(
                 id='table-editing-simple',
                 columns=(
-                    [{'id': p, 'name': p} for p in events.columns]
+                    [{'id': p, 'name': p} for p in table_columns]
                 ),
-                data=[
-                    {param: row[param] for param in events.columns} for ind, row in events.iterrows()
-                ],
+                data=rows,
                 editable=True,
-                row_deletable=True
+                row_deletable=True,
+                page_action='custom',
+                page_current=0,
+                page_size=events_to_display,
+                page_count=max(ceil(total_events / events_to_display), 1),
+                sort_action='custom',
+                sort_mode='multi',
+                sort_by=[],
+                filter_action='custom',
+                filter_query=''
             ),
+            html.P(id='table-filter-error'),
             html.P(id='placeholder4')
         ])
     elif tab == 'visuals':
         return html.Div([
-            dcc.Graph(id="baby-gantt", figure=create_gantt_fig())
+            dcc.RadioItems(
+                id='gantt-days',
+                options=[{'label': '%d days' % days, 'value': days} for days in (7, 30, 90)],
+                value=7,
+                labelStyle={'display': 'inline-block'}
+            ),
+            # the figures are filled in from the gantt-figure and trends-figure stores, see update_analytics_figures
+            dcc.Graph(id="baby-gantt"),
+            html.Div(create_averages(), id='rollup-averages'),
+            dcc.Graph(id="baby-trends"),
+            html.H6('Patterns', style={"font-size": "20px", "text-decoration": "underline"}),
+            dcc.RadioItems(
+                id='patterns-days',
+                options=[{'label': '%d months' % (days // 30), 'value': days} for days in (90, 180, 365)],
+                value=pattern_days,
+                labelStyle={'display': 'inline-block'}
+            ),
+            # filled in from the patterns-figure store, see update_patterns_figure
+            dcc.Graph(id="baby-patterns")
         ])
 
 
-@app.callback(Output('input-fields', 'children'),
-              Input('event-type', 'value'),
-              State("start-feed-time-store", "data"),
-              State("end-feed-time-store", "data"),
-              State("food-source-store", "data"),
-              State("ounces-store", "data"),
-              State("feed-comment-text-store", "data"),
-              State("potty-time-store", "data"),
-              State("potty-type-store", "data"),
-              State("potty-comment-text-store", "data"),
-              State("start-sleep-time-store", "data"),
-              State("end-sleep-time-store", "data"),
-              State("sleep-comment-text-store", "data"))
 def display_available_inputs(event_type, start_feed_time_data, end_feed_time_data, food_source_data, ounces_data,
                              feed_comment_text_data, potty_time_data, potty_type_data, potty_comment_text_data,
                              start_sleep_time_data, end_sleep_time_data, sleep_comment_text_data):
@@ -242,7 +463,7 @@ def display_available_inputs(event_type, start_feed_time_data, end_feed_time_dat
                     dcc.Input(
                         id='start-feed-time',
                         type='text',
-                        value=datetime.now().strftime("%Y-%-m-%-d %Y-%m-%-d %-I:%M %p") if start_feed_time_data[
+                        value=datetime.now().strftime("%Y-%m-%-d %-I:%M %p") if start_feed_time_data[
                                                                                                "value"] == "" else
                         start_feed_time_data["value"],
                         style={'width': '90%'}
@@ -426,63 +647,40 @@ def display_available_inputs(event_type, start_feed_time_data, end_feed_time_dat
         ])
 
 
-@app.callback(Output('start-feed-time', 'value'),
-              Input('update-start-feed-time', 'n_clicks'),
-              State('start-feed-time-store', 'data'))
-def update_start_feed_time(n_clicks, start_feed_time_store):
-    if (n_clicks is None) & (start_feed_time_store["value"] != ""):
-        new_start_feed_time = start_feed_time_store["value"]
-    else:
-        new_start_feed_time = datetime.now().strftime("%Y-%m-%-d %-I:%M %p")
-
-    return new_start_feed_time
-
-
-@app.callback(Output('end-feed-time', 'value'),
-              Input('update-end-feed-time', 'n_clicks'),
-              State('end-feed-time-store', 'data'))
-def update_end_feed_time(n_clicks, end_feed_time_store):
-    if n_clicks is None:
-        new_end_feed_time = end_feed_time_store["value"]
-    else:
-        new_end_feed_time = datetime.now().strftime("%Y-%m-%-d %-I:%M %p")
-    return new_end_feed_time
-
-
-@app.callback(Output('potty-time', 'value'),
-              Input('update-potty-time', 'n_clicks'),
-              State('potty-time-store', 'data'))
-def update_start_potty_time(n_clicks, potty_time_store):
-    if (n_clicks is None) & (potty_time_store["value"] != ""):
-        new_start_potty_time = potty_time_store["value"]
-    else:
-        new_start_potty_time = datetime.now().strftime("%Y-%m-%-d %-I:%M %p")
-    return new_start_potty_time
-
-
-@app.callback(Output('start-sleep-time', 'value'),
-              Input('update-start-sleep-time', 'n_clicks'),
-              State('start-sleep-time-store', 'data'))
-def update_start_sleep_time(n_clicks, start_sleep_time_store):
-    if (n_clicks is None) & (start_sleep_time_store["value"] != ""):
-        new_start_sleep_time = start_sleep_time_store["value"]
-    else:
-        new_start_sleep_time = datetime.now().strftime("%Y-%m-%-d %-I:%M %p")
-    return new_start_sleep_time
+# the event type buttons and "Now" buttons are handled in the browser, see assets/clientside.js
+app.clientside_callback(ClientsideFunction('baby_tracker', 'show_event_inputs'),
+                        Output('food-inputs', 'style'),
+                        Output('potty-inputs', 'style'),
+                        Output('sleep-inputs', 'style'),
+                        Input('event-type', 'value'))
 
+for time_input, time_function, form in (('start-feed-time', 'start_time', 'feed'), ('end-feed-time', 'end_time', 'feed'),
+                                        ('potty-time', 'start_time', 'potty'),
+                                        ('start-sleep-time', 'start_time', 'sleep'),
+                                        ('end-sleep-time', 'end_time', 'sleep')):
+    app.clientside_callback(ClientsideFunction('baby_tracker', time_function),
+                            Output(time_input, 'value'),
+                            Input('update-%s' % time_input, 'n_clicks'),
+                            Input('%s-submitted' % form, 'data'),
+                            State('%s-store' % time_input, 'data'))
 
-@app.callback(Output('end-sleep-time', 'value'),
-              Input('update-end-sleep-time', 'n_clicks'),
-              State('end-sleep-time-store', 'data'))
-def update_end_sleep_time(n_clicks, end_sleep_time_store):
-    if n_clicks is None:
-        new_end_sleep_time = end_sleep_time_store["value"]
-    else:
-        new_end_sleep_time = datetime.now().strftime("%Y-%m-%-d %-I:%M %p")
-    return new_end_sleep_time
+# clear the other fields of a form once its event is saved, their stores follow through store_value
+app.clientside_callback(ClientsideFunction('baby_tracker', 'reset_feed_inputs'),
+                        Output('food-source', 'value'),
+                        Output('ounces', 'value'),
+                        Output('feed-comment-text', 'value'),
+                        Input('feed-submitted', 'data'))
+app.clientside_callback(ClientsideFunction('baby_tracker', 'reset_potty_inputs'),
+                        Output('potty-type', 'value'),
+                        Output('potty-comment-text', 'value'),
+                        Input('potty-submitted', 'data'))
+app.clientside_callback(ClientsideFunction('baby_tracker', 'reset_sleep_inputs'),
+                        Output('sleep-comment-text', 'value'),
+                        Input('sleep-submitted', 'data'))
 
 
-@app.callback(Output('hidden-page-refresh1', 'href'),
+@app.callback(Output('feed-submitted', 'data'),
+              Output('placeholder', 'children'),
               Input('submit-feed-event', 'n_clicks'),
               State('event-type', 'value'),
               State('start-feed-time', 'value'),
@@ -492,44 +690,50 @@ def update_end_sleep_time(n_clicks, end_sleep_time_store):
               State('feed-comment-text', 'value'))
 def submit_feed_event(n_clicks, event_type, start_feed_time, end_feed_time, food_source, ounces, feed_comment_text):
     if n_clicks is not None:
-        event_dict = OrderedDict()
-        event_dict["Event Type"] = event_type,
-        event_dict["Start"] = start_feed_time,
-        event_dict["Duration"] = calc_duration(start_feed_time, end_feed_time),
-        event_dict["Source"] = food_source,
-        event_dict["Ounces"] = ounces,
-        event_dict["Comment"] = feed_comment_text
-        # append event to disk
-        event = pd.DataFrame(event_dict, index=[0])
-        event.to_csv('Baby_Events.csv', mode='a', header=False, index=False)
-        return "/"
+        try:
+            event_dict = OrderedDict()
+            event_dict["Event Type"] = event_type
+            event_dict["Start"] = parse_event_time(start_feed_time or "")
+            event_dict["DurationMinutes"] = calc_duration(start_feed_time or "", end_feed_time or "")
+            event_dict["Source"] = food_source
+            event_dict["Ounces"] = ounces
+            event_dict["Comment"] = feed_comment_text
+            # append event to disk
+            event_id = event_store.append(event_dict)
+        except ValueError as e:
+            return dash.no_update, str(e)
+        return event_id, saved_message(event_dict)
     else:
         raise PreventUpdate
 
 
-@app.callback(Output('hidden-page-refresh2', 'href'),
+@app.callback(Output('potty-submitted', 'data'),
+              Output('placeholder2', 'children'),
               Input('submit-potty-event', 'n_clicks'),
               State('potty-time', 'value'),
               State('potty-type', 'value'),
               State('potty-comment-text', 'value'))
 def submit_potty_event(n_clicks, potty_time, potty_type, potty_comment_text):
     if n_clicks is not None:
-        event_dict = OrderedDict()
-        event_dict["Event Type"] = potty_type,
-        event_dict["Start"] = potty_time,
-        event_dict["Duration"] = "",
-        event_dict["Source"] = "",
-        event_dict["Ounces"] = "",
-        event_dict["Comment"] = potty_comment_text
-        # append event to disk
-        event = pd.DataFrame(event_dict, index=[0])
-        event.to_csv('Baby_Events.csv', mode='a', header=False, index=False)
-        return '/'
+        try:
+            event_dict = OrderedDict()
+            event_dict["Event Type"] = potty_type
+            event_dict["Start"] = parse_event_time(potty_time or "")
+            event_dict["DurationMinutes"] = 0
+            event_dict["Source"] = None
+            event_dict["Ounces"] = None
+            event_dict["Comment"] = potty_comment_text
+            # append event to disk
+            event_id = event_store.append(event_dict)
+        except ValueError as e:
+            return dash.no_update, str(e)
+        return event_id, saved_message(event_dict)
     else:
         raise PreventUpdate
 
 
-@app.callback(Output('hidden-page-refresh3', 'href'),
+@app.callback(Output('sleep-submitted', 'data'),
+              Output('placeholder3', 'children'),
               Input('submit-sleep-event', 'n_clicks'),
               State('event-type', 'value'),
               State('start-sleep-time', 'value'),
@@ -537,17 +741,19 @@ def submit_potty_event(n_clicks, potty_time, potty_type, potty_comment_text):
               State('sleep-comment-text', 'value'))
 def submit_sleep_event(n_clicks, event_type, start_sleep_time, end_sleep_time, sleep_comment_text):
     if n_clicks is not None:
-        event_dict = OrderedDict()
-        event_dict["Event Type"] = event_type,
-        event_dict["Start"] = start_sleep_time,
-        event_dict["Duration"] = calc_duration(start_sleep_time, end_sleep_time),
-        event_dict["Source"] = "",
-        event_dict["Ounces"] = "",
-        event_dict["Comment"] = sleep_comment_text
-        # append event to disk
-        event = pd.DataFrame(event_dict, index=[0])
-        event.to_csv('Baby_Events.csv', mode='a', header=False, index=False)
-        return '/'
+        try:
+            event_dict = OrderedDict()
+            event_dict["Event Type"] = event_type
+            event_dict["Start"] = parse_event_time(start_sleep_time or "")
+            event_dict["DurationMinutes"] = calc_duration(start_sleep_time or "", end_sleep_time or "")
+            event_dict["Source"] = None
+            event_dict["Ounces"] = None
+            event_dict["Comment"] = sleep_comment_text
+            # append event to disk
+            event_id = event_store.append(event_dict)
+        except ValueError as e:
+            return dash.no_update, str(e)
+        return event_id, saved_message(event_dict)
     else:
         raise PreventUpdate
 
@@ -555,46 +761,314 @@ def submit_sleep_event(n_clicks, event_type, start_sleep_time, end_sleep_time, s
 for store_name in store_id_prefix:
     store = store_name + "-store"
 
+    app.clientside_callback(ClientsideFunction('baby_tracker', 'store_value'),
+                            Output(store, 'data'),
+                            Input(store_name, 'value'),
+                            State(store, 'data'))
 
-    @app.callback(Output(store, 'data'),
-                  Input(store_name, 'value'),
-                  State(store, 'data'))
-    def on_click(new_val, stored_val):
-        if new_val == stored_val["value"]:
-            raise PreventUpdate
 
-        data = {'value': new_val}
-        return data
+def parse_filter_query(filter_query):
+    # turn a DataTable filter_query like "{Event Type} contains Pee && {Start} >= 2021-07-01" into event_store filters
+    filters = []
+    for filter_part in filter_query.split(' && '):
+        match = filter_part_pattern.match(filter_part)
+        if match is None:
+            continue
+        value = match.group('value')
+        if len(value) > 1 and value[0] == value[-1] and value[0] in ("'", '"', '`'):
+            value = value[1:-1].replace('\\' + value[0], value[0])
+        filters.append((match.group('column'), filter_operators[match.group('operator')], value))
+    return filters
+
+
+@app.callback(
+    Output('table-editing-simple', 'data'),
+    Output('table-editing-simple', 'page_count'),
+    Output('table-editing-simple', 'page_current'),
+    Output('table-filter-error', 'children'),
+    Input('table-editing-simple', 'page_current'),
+    Input('table-editing-simple', 'page_size'),
+    Input('table-editing-simple', 'sort_by'),
+    Input('table-editing-simple', 'filter_query'),
+    Input('data-version', 'data'),
+    State('table-editing-simple', 'data'),
+    State('table-editing-simple', 'page_count'),
+    State('table-filter-error', 'children'),
+    prevent_initial_call=True)
+def update_table_page(page_current, page_size, sort_by, filter_query, data_version, rows, page_count, filter_error):
+    # a new filter or sort order starts from the first page, the page the table was on may not be there any more
+    triggered = {trigger['prop_id'] for trigger in dash.callback_context.triggered}
+    if triggered & {'table-editing-simple.filter_query', 'table-editing-simple.sort_by'}:
+        page_current = 0
+    sort_by = [("DurationMinutes" if col['column_id'] == "Duration" else col['column_id'], col['direction'] == 'asc')
+               for col in sort_by or []]
+    try:
+        filters = [("DurationMinutes", operator, parse_duration(value)) if column == "Duration"
+                   else (column, operator, value) for column, operator, value in parse_filter_query(filter_query or '')]
+        new_rows, total_events = table_page(page_current * page_size, page_size, sort_by, filters, data_version)
+        new_filter_error = ''
+    except (ValueError, KeyError) as e:
+        # a filter that can't be understood (e.g. a time without a date) shows no events rather than the old ones
+        new_rows, total_events = [], 0
+        new_filter_error = "The filter can't be used: %s" % (
+            "there is no %s column" % e.args[0] if isinstance(e, KeyError) else e)
+    new_page_count = max(ceil(total_events / page_size), 1)
+    # after a change somewhere else, only send the page if what it shows changed
+    if new_rows == rows and new_page_count == page_count and new_filter_error == (filter_error or ''):
+        raise PreventUpdate
+    return new_rows, new_page_count, page_current, new_filter_error
 
 
 @app.callback(
     Output('placeholder4', 'children'),
-    Input('table-editing-simple', 'data'),
-    Input('table-editing-simple', 'columns'))
-def table_manually_updated(rows, columns):
-    # get the events from the table, reverse the order of the rows
-    table_events = pd.DataFrame(rows, columns=[c['name'] for c in columns])[::-1]
-    # import same number of events, that are supposed to be in the table, from disk
-    disk_table_events = pd.read_csv("Baby_Events.csv")[::-1].iloc[0:events_to_display]
-
-    # If table_events had a row deleted
-    if len(table_events) < len(disk_table_events):
-        # find the row that was deleted
-        concat_rows = pd.concat([disk_table_events, table_events])
-        deleted_row = concat_rows[~concat_rows.duplicated(keep=False)]
-        # import all events from disk
-        all_events_plus_deleted = pd.concat([pd.read_csv("Baby_Events.csv"), deleted_row])
-        all_events_plus_deleted[~all_events_plus_deleted.duplicated(keep=False)].to_csv("Baby_Events.csv", index=False)
-
-    else:  # the two tables are the same size, so an edit was made
-        # import all events from disk
-        all_events = pd.read_csv("Baby_Events.csv")
-        update_all_event = pd.concat([all_events.iloc[:(len(all_events) - len(table_events))], table_events],
-                                     ignore_index=True)
-        update_all_event.to_csv("Baby_Events.csv", index=False)
-
-    return ''
+    Input('table-editing-simple', 'data_timestamp'),
+    State('table-editing-simple', 'data'),
+    State('table-editing-simple', 'data_previous'),
+    State('table-editing-simple', 'columns'))
+def table_manually_updated(data_timestamp, rows, previous_rows, columns):
+    # data_previous is only set once the user edits or deletes a row
+    if previous_rows is None:
+        raise PreventUpdate
+
+    # If a row was deleted, find it by its row id and delete it from disk
+    if len(rows) < len(previous_rows):
+        table_ids = {row["id"] for row in rows}
+        for previous_row in previous_rows:
+            if previous_row["id"] not in table_ids:
+                event_store.delete(previous_row["id"])
+        return ''
+
+    # otherwise one or more cells were edited (a paste can change several rows at once)
+    edited_rows = [i for i, (row, previous_row) in enumerate(zip(rows, previous_rows)) if row != previous_row]
+
+    errors = []
+    for i in edited_rows:
+        changes = {c['name']: rows[i][c['id']] for c in columns if rows[i][c['id']] != previous_rows[i][c['id']]}
+        if changes:
+            try:
+                event_store.update(rows[i]["id"], table_changes_to_event(changes))
+            except ValueError as e:
+                errors.append("Row %d was not saved: %s" % (i + 1, e))
+
+    return ' '.join(errors)
+
+
+# live updates: every open page asks for the data version every few seconds, which is answered without reading any
+# events unless something changed, and the History page and Analytics chart refresh when it goes up. A new version is
+# only sent once the figures and table pages have been rebuilt for it in the background. Each gunicorn worker publishes
+# versions on its own, a poll answered by a worker that is behind must not take a page back to an older version.
+@app.callback(Output('data-version', 'data'),
+              Input('live-updates', 'n_intervals'),
+              State('data-version', 'data'))
+def poll_data_version(n_intervals, data_version):
+    version = response_cache.published_version()
+    if data_version is not None and version <= data_version:
+        raise PreventUpdate
+    return version
+
+
+# sends the Analytics figures when the page doesn't have the current version of them yet, like an ETag: a page that
+# is up to date gets an empty "no update" response
+@app.callback(Output('gantt-figure', 'data'),
+              Output('gantt-figure-key', 'data'),
+              Output('trends-figure', 'data'),
+              Output('trends-figure-key', 'data'),
+              Input('gantt-days', 'value'),
+              Input('data-version', 'data'),
+              State('gantt-figure-key', 'data'),
+              State('trends-figure-key', 'data'))
+def update_analytics_figures(n_days_back, data_version, gantt_key, trends_key):
+    # the Analytics tab isn't open
+    if n_days_back is None:
+        raise PreventUpdate
+    # the figures are rebuilt in the background after every change, this only looks up the latest builds
+    (new_gantt_key, gantt_json), (new_trends_key, trends_json) = figure_json("gantt", n_days_back, data_version), \
+        figure_json("trends", trend_days, data_version)
+    if new_gantt_key == gantt_key and new_trends_key == trends_key:
+        raise PreventUpdate
+    return (json.loads(gantt_json) if new_gantt_key != gantt_key else dash.no_update,
+            new_gantt_key,
+            json.loads(trends_json) if new_trends_key != trends_key else dash.no_update,
+            new_trends_key)
+
+
+# the Patterns figure has its own callback, so changing the months shown doesn't send the other figures again
+@app.callback(Output('patterns-figure', 'data'),
+              Output('patterns-figure-key', 'data'),
+              Input('patterns-days', 'value'),
+              Input('data-version', 'data'),
+              State('patterns-figure-key', 'data'))
+def update_patterns_figure(n_days_back, data_version, patterns_key):
+    if n_days_back is None:
+        raise PreventUpdate
+    new_patterns_key, patterns_json = figure_json("patterns", n_days_back, data_version)
+    if new_patterns_key == patterns_key:
+        raise PreventUpdate
+    return json.loads(patterns_json), new_patterns_key
+
+
+for figure_graph, figure_store in (('baby-gantt', 'gantt-figure'), ('baby-trends', 'trends-figure'),
+                                   ('baby-patterns', 'patterns-figure')):
+    app.clientside_callback(ClientsideFunction('baby_tracker', 'show_figure'),
+                            Output(figure_graph, 'figure'),
+                            Input(figure_store, 'data'))
+
+
+@app.callback(Output('rollup-averages', 'children'),
+              Input('data-version', 'data'),
+              prevent_initial_call=True)
+def update_rollup_panels(data_version):
+    return create_averages()
+
+
+@app.callback(Output('event-status', 'children'),
+              Input('status-refresh', 'n_intervals'),
+              Input('data-version', 'data'),
+              prevent_initial_call=True)
+def update_status(n_intervals, data_version):
+    return create_status()
+
+
+# answers with 304 Not Modified when the client already has this version of the response. Flask-Compress adds the
+# encoding to the ETag of a compressed response (e.g. "abc:br"), so those count as a match as well.
+def conditional_response(response, etag):
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    if any(request.if_none_match.contains(tag) for tag in
+           [etag] + ["%s:%s" % (etag, algorithm) for algorithm in app.server.config["COMPRESS_ALGORITHM"]]):
+        not_modified = app.server.response_class(status=304)
+        not_modified.set_etag(etag)
+        not_modified.cache_control.no_cache = True
+        return not_modified
+    return response
+
+
+# the data version for other clients, with an ETag so an unchanged version is answered with 304 Not Modified
+@app.server.route('/api/version')
+def api_version():
+    response = jsonify(version=event_store.version())
+    return conditional_response(response, str(response.json["version"]))
+
+
+# the events inserted or updated and the ids of the events deleted since ?since=<data version>. When the change log
+# doesn't go back that far the response only has the version and "reset": true, and everything has to be reloaded.
+@app.server.route('/api/changes')
+def api_changes():
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify(error="since=<data version> is missing"), 400
+    version, changes = event_store.changes(since)
+    if changes is None:
+        return jsonify(version=version, reset=True)
+    # only the last change to each event matters
+    last_operations = OrderedDict((change["id"], change["operation"]) for change in changes)
+    changed_ids = [event_id for event_id, operation in last_operations.items() if operation != "delete"]
+    changed_events = event_store.events_by_id(changed_ids)
+    return jsonify(version=version, events=events_to_table_data(changed_events),
+                   deleted=[event_id for event_id, operation in last_operations.items() if operation == "delete"])
+
+
+# an Analytics figure as plotly JSON, e.g. /api/figures/gantt?days=30, with an ETag so an unchanged figure is answered
+# with 304 Not Modified
+@app.server.route('/api/figures/<name>')
+def api_figure(name):
+    n_days_back = request.args.get('days', type=int, default=figure_default_days.get(name))
+    if name not in figure_builders or n_days_back is None or not 0 < n_days_back <= 366:
+        return jsonify(error="unknown figure or number of days"), 404
+    key, body = figure_json(name, n_days_back)
+    return conditional_response(app.server.response_class(body, mimetype="application/json"), key)
+
+
+# the last event of each type and food source, and how many minutes ago they started and ended
+@app.server.route('/api/status')
+def api_status():
+    now = datetime.now()
+    last_events = event_store.last_events()
+    for events in last_events.values():
+        for key, event in events.items():
+            if event is not None:
+                events[key] = OrderedDict([
+                    ("id", event["id"]),
+                    ("Event Type", event["Event Type"]),
+                    ("Start", event["Start"].strftime("%Y-%m-%d %H:%M")),
+                    ("End", event["End"].strftime("%Y-%m-%d %H:%M")),
+                    ("Source", event["Source"]),
+                    ("MinutesSinceStart", (now - event["Start"]) // timedelta(minutes=1)),
+                    ("MinutesSinceEnd", (now - event["End"]) // timedelta(minutes=1)),
+                ])
+    return jsonify(now=now.strftime("%Y-%m-%d %H:%M"), version=event_store.version(),
+                   last_event_type=last_events["Event Type"], last_source=last_events["Source"])
+
+
+# adds the events in the request body, a csv or json export (see event_transfer.py), e.g.
+#     curl --data-binary @old_tracker.csv http://pi:8050/api/import?format=csv
+# and answers with how many were imported, skipped as duplicates and skipped as invalid
+@app.server.route('/api/import', methods=['POST'])
+def api_import():
+    file_format = request.args.get('format') or ("json" if request.mimetype == "application/json" else "csv")
+    if file_format not in import_formats:
+        return jsonify(error="unknown format, use one of: %s" % ", ".join(import_formats)), 400
+    try:
+        # a reader that only needs read() from the stream, gunicorn's request body has nothing else
+        report = import_events(event_store, codecs.getreader("utf-8-sig")(request.stream), file_format)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(report)
+
+
+# the events from ?start= up to ?end= (both optional, e.g. 2021-07-01) as a csv or Parquet (?format=parquet) file,
+# sent a chunk of events at a time
+@app.server.route('/api/export')
+def api_export():
+    file_format = request.args.get('format', 'csv')
+    try:
+        start, end = parse_range_bound(request.args.get('start')), parse_range_bound(request.args.get('end'))
+        chunks = export_events(event_store, file_format, start, end)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    file_name = "baby_events%s%s.%s" % ("_from_%s" % start.strftime("%Y-%m-%d") if start else "",
+                                        "_to_%s" % end.strftime("%Y-%m-%d") if end else "", file_format)
+    return app.server.response_class(
+        stream_with_context(chunks), mimetype="text/csv" if file_format == "csv" else "application/octet-stream",
+        headers={"Content-Disposition": "attachment; filename=%s" % file_name})
+
+
+# set once the first callback has been answered. On a single core the prewarm thread would slow down the first page
+# load, so it waits for that (or prewarm_delay seconds, whichever comes first).
+first_callback_answered = threading.Event()
+prewarm_delay = 30
+
+
+@app.server.after_request
+def note_first_callback(response):
+    if not first_callback_answered.is_set() and request.path.endswith('/_dash-update-component'):
+        first_callback_answered.set()
+    return response
+
+
+# imports the analytics libraries and builds the first History page and the Analytics figures in the background, so
+# the first phone to open those tabs after a restart doesn't wait for them. Called once the server is listening,
+# set BABY_TRACKER_PREWARM=0 to turn it off.
+def prewarm():
+    if os.environ.get("BABY_TRACKER_PREWARM", "1") == "0":
+        return
+
+    def run():
+        first_callback_answered.wait(prewarm_delay)
+        started = time.perf_counter()
+        try:
+            table_page(0, events_to_display)
+            figure_json("gantt", 7)
+            figure_json("trends", trend_days)
+            figure_json("patterns", pattern_days)
+        except Exception:
+            app.server.logger.exception("prewarming the caches failed")
+            return
+        app.server.logger.info("caches prewarmed in %.1f s", time.perf_counter() - started)
+
+    threading.Thread(target=run, name="prewarm", daemon=True).start()
 
 
 if __name__ == '__main__':
+    prewarm()
     app.run_server(debug=False, host="0.0.0.0", port=8050)
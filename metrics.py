@@ -0,0 +1,181 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, g, has_request_context
+
+logger = logging.getLogger("baby_tracker.metrics")
+
+# histogram buckets, in seconds for times and bytes for payloads
+time_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+size_buckets = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# callbacks slower than this many milliseconds are logged, unset to log none
+slow_callback_ms = float(os.environ["BABY_TRACKER_SLOW_CALLBACK_MS"]) \
+    if os.environ.get("BABY_TRACKER_SLOW_CALLBACK_MS") else None
+# the fraction of callbacks run under the profiler while slow callbacks are logged, a slow one that was profiled is
+# logged with its profile
+profile_sample_rate = float(os.environ.get("BABY_TRACKER_PROFILE_SAMPLE", "0.05"))
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        # per label value: the count in each bucket (not cumulative), the sum and the count
+        self._series = OrderedDict()
+
+    # must be called with the Metrics lock held
+    def observe(self, label, value):
+        series = self._series.get(label)
+        if series is None:
+            series = self._series[label] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bucket in enumerate(self.buckets):
+            if value <= bucket:
+                series[0][i] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    # must be called with the Metrics lock held
+    def exposition(self, label_name, extra_labels):
+        lines = ["# HELP %s %s" % (self.name, self.help_text), "# TYPE %s histogram" % self.name]
+        for label, (bucket_counts, total, count) in self._series.items():
+            labels = '%s="%s"%s' % (label_name, label, extra_labels)
+            cumulative = 0
+            for bucket, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append('%s_bucket{%s,le="%g"} %d' % (self.name, labels, bucket, cumulative))
+            lines.append('%s_bucket{%s,le="+Inf"} %d' % (self.name, labels, count))
+            lines.append("%s_sum{%s} %r" % (self.name, labels, total))
+            lines.append("%s_count{%s} %d" % (self.name, labels, count))
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = OrderedDict()
+
+    # must be called with the Metrics lock held
+    def increment(self, label, amount):
+        self._values[label] = self._values.get(label, 0) + amount
+
+    # must be called with the Metrics lock held
+    def exposition(self, label_name, extra_labels):
+        lines = ["# HELP %s %s" % (self.name, self.help_text), "# TYPE %s counter" % self.name]
+        lines += ['%s{%s="%s"%s} %d' % (self.name, label_name, label, extra_labels, value)
+                  for label, value in self._values.items()]
+        return lines
+
+
+# times every Dash callback, counts the event rows it read and wrote, and measures the size of its response. Each
+# gunicorn worker keeps its own numbers, so they are labelled with the worker's process id.
+class Metrics:
+    def __init__(self, event_store):
+        self.event_store = event_store
+        self._lock = threading.Lock()
+        self.callback_seconds = Histogram(
+            "dash_callback_seconds", "Time spent in the callback function itself", time_buckets)
+        self.request_seconds = Histogram(
+            "dash_callback_request_seconds", "Time to answer the callback request, including JSON serialization",
+            time_buckets)
+        self.response_bytes = Histogram(
+            "dash_callback_response_bytes", "Size of the callback response before compression", size_buckets)
+        self.rows_read = Counter("dash_callback_rows_read_total", "Event rows read from the database")
+        self.rows_written = Counter("dash_callback_rows_written_total", "Event rows written to the database")
+
+    # wraps a callback function to time it, and to profile a sample of calls when slow callbacks are logged
+    def timed(self, func):
+        name = func.__name__
+
+        @wraps(func)
+        def timed_callback(*args, **kwargs):
+            # called outside of a request by the benchmark
+            if has_request_context():
+                g.callback_name = name
+            rows_read, rows_written = self.event_store.io_counters()
+            profiler = None
+            if slow_callback_ms is not None and random.random() < profile_sample_rate:
+                profiler = cProfile.Profile()
+            started = time.perf_counter()
+            try:
+                if profiler is None:
+                    return func(*args, **kwargs)
+                return profiler.runcall(func, *args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                now_read, now_written = self.event_store.io_counters()
+                with self._lock:
+                    self.callback_seconds.observe(name, elapsed)
+                    self.rows_read.increment(name, now_read - rows_read)
+                    self.rows_written.increment(name, now_written - rows_written)
+                if slow_callback_ms is not None and elapsed * 1000 > slow_callback_ms:
+                    self._log_slow_callback(name, elapsed, now_read - rows_read, now_written - rows_written,
+                                            profiler)
+
+        return timed_callback
+
+    @staticmethod
+    def _log_slow_callback(name, elapsed, rows_read, rows_written, profiler):
+        message = "slow callback %s: %.0f ms, %d rows read, %d rows written" % (
+            name, elapsed * 1000, rows_read, rows_written)
+        if profiler is not None:
+            profile = io.StringIO()
+            pstats.Stats(profiler, stream=profile).sort_stats("cumulative").print_stats(15)
+            message += "\n" + profile.getvalue()
+        logger.warning(message)
+
+    def before_request(self):
+        g.request_started = time.perf_counter()
+
+    def after_request(self, response):
+        name = g.get("callback_name")
+        if name is not None:
+            with self._lock:
+                self.request_seconds.observe(name, time.perf_counter() - g.request_started)
+                # a 204 (no update) response has no body
+                self.response_bytes.observe(name, response.content_length or 0)
+        return response
+
+    def exposition(self):
+        extra_labels = ',worker="%d"' % os.getpid()
+        lines = []
+        with self._lock:
+            for metric in (self.callback_seconds, self.request_seconds, self.response_bytes, self.rows_read,
+                           self.rows_written):
+                lines += metric.exposition("callback", extra_labels)
+        database_bytes = sum(os.path.getsize(path) for path in (self.event_store.path, self.event_store.path + "-wal")
+                             if os.path.exists(path))
+        lines += ["# HELP event_database_bytes Size of the event database and its write ahead log",
+                  "# TYPE event_database_bytes gauge",
+                  'event_database_bytes{worker="%d"} %d' % (os.getpid(), database_bytes)]
+        return "\n".join(lines) + "\n"
+
+
+# instruments every callback registered on the app from now on, and serves the numbers on /metrics
+def instrument_app(app, event_store):
+    metrics = Metrics(event_store)
+    dash_callback = app.callback
+
+    @wraps(dash_callback)
+    def callback(*args, **kwargs):
+        register = dash_callback(*args, **kwargs)
+        return lambda func: register(metrics.timed(func))
+
+    app.callback = callback
+    # registered after Flask-Compress, so it runs first and sees the uncompressed size
+    app.server.before_request(metrics.before_request)
+    app.server.after_request(metrics.after_request)
+    app.server.add_url_rule('/metrics', 'metrics',
+                            lambda: Response(metrics.exposition(), mimetype="text/plain; version=0.0.4"))
+    return metrics
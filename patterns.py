@@ -0,0 +1,72 @@
+from lazy_import import LazyModule
+
+np = LazyModule("numpy")
+
+minutes_per_day = 24 * 60
+# feeds further apart than this are taken to be a gap in the tracking, not a long stretch between feeds
+max_feed_interval = 12 * 60
+
+
+# the minutes of each time bucket covered by at least one of the events, as an array of (day, bucket of the day).
+# starts are minutes since midnight of the first day and may be before it, events running past the last day are cut
+# off. Every event adds 1 where it starts and takes 1 away where it ends in an array with one entry per minute, the
+# running total of which is the number of events going on in each minute.
+def covered_minutes(starts, durations, n_days, bucket_minutes):
+    total_minutes = n_days * minutes_per_day
+    ends = np.clip(starts + durations, 0, total_minutes)
+    starts = np.clip(starts, 0, total_minutes)
+    changes = np.bincount(starts, minlength=total_minutes + 1) - np.bincount(ends, minlength=total_minutes + 1)
+    covered = np.cumsum(changes[:total_minutes]) > 0
+    return covered.reshape(n_days, minutes_per_day // bucket_minutes, bucket_minutes).sum(axis=2)
+
+
+# the number of events starting in each time bucket, as an array of (day, bucket of the day)
+def event_counts(starts, n_days, bucket_minutes):
+    starts = starts[(starts >= 0) & (starts < n_days * minutes_per_day)]
+    buckets_per_day = minutes_per_day // bucket_minutes
+    return np.bincount(starts // bucket_minutes, minlength=n_days * buckets_per_day).reshape(n_days, buckets_per_day)
+
+
+# the mean over the last window days (fewer for the first days) of a daily total of sums and counts, NaN for windows
+# without any counts
+def rolling_mean(sums, counts, window):
+    sums, counts = np.concatenate([[0], np.cumsum(sums)]), np.concatenate([[0], np.cumsum(counts)])
+    ends = np.arange(1, len(sums))
+    starts = np.maximum(ends - window, 0)
+    window_counts = counts[ends] - counts[starts]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(window_counts > 0, (sums[ends] - sums[starts]) / window_counts, np.nan)
+
+
+# the feed intervals (from one feed to the next, in minutes) ending on each day, as (sum, count) per day
+def daily_feed_intervals(feed_starts, n_days):
+    feed_starts = np.sort(feed_starts)
+    intervals, days = np.diff(feed_starts), feed_starts[1:] // minutes_per_day
+    kept = (days >= 0) & (days < n_days) & (intervals <= max_feed_interval)
+    return (np.bincount(days[kept], weights=intervals[kept], minlength=n_days),
+            np.bincount(days[kept], minlength=n_days))
+
+
+# binned activity of the n_days from first_day (a midnight), from the events of those days and the day before (for
+# events running over midnight and the first feed interval): the minutes asleep and feeding and the number of pees
+# and poos in each bucket_minutes of every day, and the 7 day (rolling_days) averages of the hours asleep per day and
+# the hours between feeds
+def activity_patterns(events, first_day, n_days, bucket_minutes=30, rolling_days=7):
+    starts = ((events["Start"].values - np.datetime64(first_day)) // np.timedelta64(1, "m")).astype(np.int64)
+    durations = events["DurationMinutes"].values.astype(np.int64)
+    event_types = events["Event Type"].astype(str).values
+
+    is_sleep, is_food = event_types == "Sleep", event_types == "Food"
+    asleep = covered_minutes(starts[is_sleep], durations[is_sleep], n_days, bucket_minutes)
+    feeding = covered_minutes(starts[is_food], durations[is_food], n_days, bucket_minutes)
+    potty = event_counts(starts[(event_types == "Pee") | (event_types == "Poo")], n_days, bucket_minutes)
+
+    sleep_minutes = asleep.sum(axis=1)
+    interval_sums, interval_counts = daily_feed_intervals(starts[is_food], n_days)
+    return {
+        "Asleep": asleep,
+        "Feeding": feeding,
+        "Potty": potty,
+        "Sleep hours": rolling_mean(sleep_minutes / 60, np.ones(n_days), rolling_days),
+        "Feed interval hours": rolling_mean(interval_sums / 60, interval_counts, rolling_days),
+    }
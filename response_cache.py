@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("baby_tracker.response_cache")
+
+
+# the newest build of each expensive view (figures, table pages), keyed by the view's name and parameters and labelled
+# with the data version it was built from. After every change a background thread rebuilds the views served lately,
+# so the requests after a change don't have to: until it is done they are answered with the last build at once.
+# Changes that come in quick succession are rebuilt for together, each view is queued at most once.
+class VersionedCache:
+    def __init__(self, event_store, max_entries=64, hot_seconds=15 * 60):
+        self.event_store = event_store
+        self.max_entries = max_entries
+        # views served within this many seconds are rebuilt after every change, the others when they are next asked for
+        self.hot_seconds = hot_seconds
+        self._lock = threading.Lock()
+        self._work_queued = threading.Condition(self._lock)
+        # view -> (data version, key, value) of its newest build, the least recently used are dropped first
+        self._builds = OrderedDict()
+        # view -> (build function, when it was last served)
+        self._views = {}
+        # the views waiting to be rebuilt, in the order they were queued, and the one being rebuilt
+        self._queued = OrderedDict()
+        self._rebuilding = None
+        # the data version the views are being rebuilt for, and the newest one all of them have been rebuilt for
+        self._target_version = self._published_version = event_store.version()
+        event_store.add_listener(lambda changed_events: self.refresh())
+        threading.Thread(target=self._rebuild_views, name="view-rebuilder", daemon=True).start()
+
+    # the key of a view built from a data version, also usable as an ETag since it changes whenever the view could have
+    @staticmethod
+    def _key(name, version, params):
+        return "%s-%s-%s" % (name, version, "-".join(str(param) for param in params))
+
+    # the key and value of the view, from its newest build unless that is older than the published version, in which
+    # case it is built now. A build older than the current data version is served as it is while it is rebuilt.
+    # min_version is the data version the page asking already has: each gunicorn worker publishes versions on its own,
+    # so the page may have had a newer one from another worker, and must not be sent an older build than that.
+    def get(self, name, params, build, min_version=None):
+        view = (name, tuple(params))
+        version = self.event_store.version()
+        with self._lock:
+            self._views[view] = build, time.time()
+            built = self._builds.get(view)
+            if built is not None and built[0] >= min(version, max(self._published_version, min_version or 0)):
+                self._builds.move_to_end(view)
+                if built[0] < version:
+                    self._queue(view)
+                return built[1], built[2]
+        value = build()
+        with self._lock:
+            return self._save(view, version, value)[1:]
+
+    # must be called with self._lock held, returns the newest build of the view
+    def _save(self, view, version, value):
+        built = self._builds.get(view)
+        # a build started earlier may finish later, never replace a newer one
+        if built is None or built[0] <= version:
+            built = self._builds[view] = version, self._key(view[0], version, view[1]), value
+        self._builds.move_to_end(view)
+        while len(self._builds) > self.max_entries:
+            self._builds.popitem(last=False)
+        return built
+
+    # must be called with self._lock held. A view being rebuilt is queued again once it is done, if a change came in
+    # while it was being built.
+    def _queue(self, view):
+        if view != self._rebuilding:
+            self._queued[view] = True
+            self._work_queued.notify()
+
+    # queues the views served lately to be rebuilt for the current data version, called after every change made
+    # through this process's event store, and by published_version() for changes made by other processes
+    def refresh(self):
+        version = self.event_store.version()
+        with self._lock:
+            if version <= self._target_version:
+                return
+            self._target_version = version
+            served_since = time.time() - self.hot_seconds
+            for view, (build, last_served) in list(self._views.items()):
+                if last_served < served_since:
+                    del self._views[view]
+                else:
+                    self._queue(view)
+            if not self._queued and self._rebuilding is None:
+                self._published_version = version
+
+    # the newest data version all the views served lately have been rebuilt for. Pages are only told about a new
+    # version once it is published, so by the time they ask for their views they are ready.
+    def published_version(self):
+        self.refresh()
+        with self._lock:
+            return self._published_version
+
+    def _rebuild_views(self):
+        while True:
+            with self._lock:
+                while not self._queued:
+                    self._work_queued.wait()
+                view, _ = self._queued.popitem(last=False)
+                build = self._views.get(view, (None,))[0]
+                self._rebuilding = view
+            value = None
+            if build is not None:
+                version = self.event_store.version()
+                try:
+                    value = build()
+                except Exception:
+                    logger.exception("rebuilding %s failed", view[0])
+            with self._lock:
+                self._rebuilding = None
+                if value is not None:
+                    self._save(view, version, value)
+                # a change came in while it was being built
+                if build is not None and version < self._target_version:
+                    self._queue(view)
+                if not self._queued:
+                    self._published_version = max(self._published_version, self._target_version)
+
+    # forgets every build, e.g. for timing the views from scratch
+    def clear(self):
+        with self._lock:
+            self._builds.clear()
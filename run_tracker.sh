@@ -1,4 +1,4 @@
 #!/bin/bash
 cd ~/Baby_Tracker_App
 source env/bin/activate
-python main.py
+gunicorn -c gunicorn.conf.py wsgi:server
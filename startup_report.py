@@ -0,0 +1,124 @@
+# Measures how long the app takes to start, with the analytics libraries imported lazily (the default) and eagerly.
+#
+#     python startup_report.py --runs 5
+#
+# For each mode it times "import main" on its own, then starts gunicorn with one worker and times how long it takes
+# until the page loads and until the first Input, History and Analytics responses come back. Everything runs on a
+# copy of Baby_Events.db (or on a year of synthetic events if there is none), so it is safe to run next to the app.
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from load_test import project_dir, render_tab_request, wait_until_up
+
+modes = (
+    ("lazy imports", {}),
+    ("eager imports", {"BABY_TRACKER_EAGER_IMPORTS": "1", "BABY_TRACKER_PREWARM": "0"}),
+)
+
+
+def copy_events(db_path, run_dir):
+    copy_path = os.path.join(run_dir, "Baby_Events.db")
+    if os.path.exists(db_path):
+        # the backup API also copies anything still in the write ahead log
+        with sqlite3.connect(db_path) as source, sqlite3.connect(copy_path) as copy:
+            source.backup(copy)
+        return
+    from benchmark import generate_events, write_legacy_csv
+    write_legacy_csv(generate_events(1), os.path.join(run_dir, "Baby_Events.csv"))
+    subprocess.run([sys.executable, "-c", "import sys; sys.path.insert(0, %r); from event_store import EventStore; "
+                                          "EventStore('Baby_Events.db').migrate_csv('Baby_Events.csv')" % project_dir],
+                   cwd=run_dir, check=True)
+
+
+def time_import(run_dir, env):
+    output = subprocess.run(
+        [sys.executable, "-c", "import sys, time; sys.path.insert(0, %r); started = time.perf_counter(); "
+                               "import main; print(time.perf_counter() - started)" % project_dir],
+        cwd=run_dir, env=env, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    return float(output.stdout.split()[-1])
+
+
+def time_request(request):
+    started = time.perf_counter()
+    urllib.request.urlopen(request, timeout=120).read()
+    return time.perf_counter() - started
+
+
+def time_server(run_dir, env, port):
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--chdir", run_dir, "--pythonpath", project_dir,
+         "-c", os.path.join(project_dir, "gunicorn.conf.py"), "--bind", "127.0.0.1:%d" % port, "--workers", "1",
+         "wsgi:server"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(port, timeout=120)
+        page_loaded = time.perf_counter() - started
+        return (page_loaded,
+                time_request(render_tab_request(port, "event-input")),
+                time_request(render_tab_request(port, "tables")),
+                time_request("http://127.0.0.1:%d/api/figures/gantt?days=7" % port))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def slowest_imports(run_dir, count=10):
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import sys; sys.path.insert(0, %r); "
+                                                                      "import main" % project_dir],
+                            cwd=run_dir, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            universal_newlines=True).stderr
+    # a module is listed after everything it imports, with names indented by two spaces per level. Keep the modules
+    # main imports itself, their time includes everything they import.
+    imports = []
+    for line in output.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        depth = (len(parts[2]) - len(parts[2].lstrip()) - 1) // 2
+        if depth == 1:
+            imports.append((int(parts[1]), parts[2].strip()))
+        elif depth == 0:
+            if parts[2].strip() == "main":
+                break
+            imports = []
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures how long the app takes to start")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--db", default=os.path.join(project_dir, "Baby_Events.db"))
+    parser.add_argument("--port", type=int, default=8151)
+    args = parser.parse_args()
+
+    run_dir = tempfile.mkdtemp()
+    try:
+        copy_events(args.db, run_dir)
+        print("median of %d runs, in seconds" % args.runs)
+        print("%-14s %11s %11s %11s %11s %11s" % ("", "import main", "page loads", "Input tab", "History tab",
+                                                  "Analytics"))
+        for mode, mode_env in modes:
+            env = dict(os.environ, **mode_env)
+            import_times = [time_import(run_dir, env) for _ in range(args.runs)]
+            server_times = [time_server(run_dir, env, args.port) for _ in range(args.runs)]
+            print("%-14s %11.2f %s" % (mode, statistics.median(import_times), " ".join(
+                "%11.2f" % statistics.median(times) for times in zip(*server_times))))
+
+        print("\nslowest top level imports of main.py (lazy), in milliseconds")
+        for microseconds, module in slowest_imports(run_dir):
+            print("%8.0f  %s" % (microseconds / 1000, module))
+    finally:
+        shutil.rmtree(run_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+# the app's modules sit at the top of the repository, next to main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from event_store import EventStore  # noqa: E402
+
+
+@pytest.fixture
+def event_store(tmp_path):
+    return EventStore(str(tmp_path / "Baby_Events.db"))
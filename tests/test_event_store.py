@@ -0,0 +1,99 @@
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from event_store import EventStore, validate_event
+
+first_day = datetime(2021, 7, 1)
+
+
+def random_event(rng):
+    event_type = rng.choice(["Food", "Sleep", "Sleep", "Pee", "Poo"])
+    return {
+        "Event Type": event_type,
+        # some events run over midnight, and a few for more than a day
+        "Start": first_day + timedelta(minutes=rng.randrange(10 * 24 * 60)),
+        "DurationMinutes": rng.choice([0, 15, 90, 600, 2000]) if event_type in ("Food", "Sleep") else 0,
+        "Source": rng.choice(["Left", "Right", "Bottle"]) if event_type == "Food" else None,
+        "Ounces": rng.choice([None, 2.5, 4]) if event_type == "Food" else None,
+    }
+
+
+def saved_rollups(event_store):
+    with event_store._lock:
+        return event_store._conn.execute("SELECT * FROM daily_rollups ORDER BY day, event_type, source").fetchall()
+
+
+# the rollups kept up to date with every change must be the ones a full rebuild makes
+@pytest.mark.parametrize("seed", range(5))
+def test_rollups_match_a_full_rebuild(event_store, seed):
+    rng = random.Random(seed)
+    event_ids = []
+    for _ in range(200):
+        action = rng.random()
+        if action < 0.4 or not event_ids:
+            event_ids.append(event_store.append(random_event(rng)))
+        elif action < 0.5:
+            # imports update the rollups in bulk, duplicates included
+            event_store.import_rows([validate_event(random_event(rng)) for _ in range(5)] * 2)
+        elif action < 0.8:
+            event = random_event(rng)
+            changes = {column: event[column] for column in rng.sample(sorted(event), rng.randint(1, len(event)))}
+            event_store.update(rng.choice(event_ids), changes)
+        else:
+            event_store.delete(event_ids.pop(rng.randrange(len(event_ids))))
+    kept_up_to_date = saved_rollups(event_store)
+
+    with event_store._lock, event_store._conn:
+        event_store._rebuild_rollups()
+    assert kept_up_to_date == saved_rollups(event_store)
+
+
+def write_version_1_database(path, events):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE events (id INTEGER PRIMARY KEY, event_type TEXT, start TEXT, duration TEXT, "
+                 "source TEXT, ounces REAL, comment TEXT)")
+    conn.execute("CREATE INDEX events_start ON events (start)")
+    conn.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?)", events)
+    conn.commit()
+    conn.close()
+
+
+version_1_events = [
+    (3, "Sleep", "2021-07-05 13:00", "1h 25m", None, None, None),
+    (5, None, "2021-07-05 15:00", "0h 10m", None, None, None),
+    (8, "Food", "2021-07-05 16:00", "0h 20m", "Left", None, "hungry"),
+]
+
+
+def test_version_1_database_is_upgraded(tmp_path):
+    path = str(tmp_path / "Baby_Events.db")
+    write_version_1_database(path, version_1_events)
+    event_store = EventStore(path)
+
+    events = event_store.range()
+    # the event without a type is skipped and kept in the rejected file, the others keep their ids
+    assert list(events["id"]) == [3, 8]
+    assert list(events["DurationMinutes"]) == [85, 20]
+    assert "not an event type" in (tmp_path / "Baby_Events.db.rejected").read_text()
+    assert len(event_store.rollups()) == 2
+
+
+def test_interrupted_upgrade_leaves_the_database_as_it_was(tmp_path, monkeypatch):
+    path = str(tmp_path / "Baby_Events.db")
+    write_version_1_database(path, version_1_events)
+
+    def power_cut(event_store):
+        raise RuntimeError("power cut")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(EventStore, "_rebuild_rollups", power_cut)
+        with pytest.raises(RuntimeError):
+            EventStore(path)
+    conn = sqlite3.connect(path)
+    assert [row[1] for row in conn.execute("PRAGMA table_info(events)")][3] == "duration"
+    conn.close()
+
+    assert list(EventStore(path).range()["id"]) == [3, 8]
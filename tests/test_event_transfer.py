@@ -0,0 +1,60 @@
+import io
+import json
+
+import pytest
+
+from event_transfer import _json_records, import_events
+
+events = [{"Event Type": "Pee", "Start": "2021-07-05 %d:00 PM" % hour} for hour in range(1, 7)]
+
+
+def test_csv_rows_that_are_not_events_are_reported(event_store):
+    csv_text = "\ufeffEvent Type,Start,Duration\nSleep,2021-07-05 1:00 PM,1h 25m\nFood,2021-07-05 3:00 PM,-1h 30m\n" \
+               ",2021-07-05 4:00 PM,\n"
+    report = import_events(event_store, io.StringIO(csv_text), "csv")
+    assert report["imported"] == 1
+    assert report["invalid"] == 2
+    assert report["errors"][0].startswith("row 3: '-1h 30m' is not a valid duration")
+
+
+def test_importing_twice_skips_the_duplicates(event_store):
+    json_text = json.dumps(events)
+    assert import_events(event_store, io.StringIO(json_text), "json")["imported"] == len(events)
+    report = import_events(event_store, io.StringIO(json_text), "json")
+    assert (report["imported"], report["duplicates"]) == (0, len(events))
+
+
+# the events before a broken record of an array are imported, and the break is the last invalid row
+def test_broken_json_array_is_reported_as_an_invalid_row(event_store):
+    records = [json.dumps(event) for event in events[:4]] + ['{"Event Type": oops}'] + \
+        [json.dumps(event) for event in events[4:]]
+    json_text = "[%s]" % ", ".join(records)
+    report = import_events(event_store, io.StringIO(json_text), "json")
+    assert report["imported"] == 4
+    assert report["invalid"] == 1
+    assert report["errors"][0].startswith("row 5: ")
+    assert report["errors"][0].endswith("the rest of the file could not be read")
+    assert len(event_store.range()) == 4
+
+
+def test_unclosed_json_array_is_reported_as_an_invalid_row(event_store):
+    report = import_events(event_store, io.StringIO(json.dumps(events)[:-1]), "json")
+    assert (report["imported"], report["invalid"]) == (len(events), 1)
+    assert "isn't closed" in report["errors"][0]
+
+
+def test_broken_json_line_is_one_invalid_row(event_store):
+    lines = [json.dumps(event) for event in events]
+    lines[2] = lines[2][:-1]
+    report = import_events(event_store, io.StringIO("\n".join(lines)), "json")
+    assert (report["imported"], report["invalid"]) == (len(events) - 1, 1)
+    assert report["errors"][0].startswith("row 3: ")
+
+
+# arrays and lines are read a piece at a time, records split across the pieces must come out whole
+@pytest.mark.parametrize("read_size", [1, 7, 64, 65536])
+@pytest.mark.parametrize("as_lines", [False, True])
+def test_json_records_read_in_pieces(read_size, as_lines):
+    json_text = "\n".join(json.dumps(event) for event in events) if as_lines else json.dumps(events, indent=2)
+    records = [record for number, record in _json_records(io.StringIO(json_text), read_size)]
+    assert records == events
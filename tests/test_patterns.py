@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from patterns import (covered_minutes, daily_feed_intervals, event_counts, max_feed_interval, minutes_per_day,
+                      rolling_mean)
+
+n_days = 4
+
+
+def random_events(seed, n_events=40):
+    rng = np.random.default_rng(seed)
+    # starts from the day before the first day (events running into it) to past the last day
+    starts = rng.integers(-minutes_per_day, (n_days + 1) * minutes_per_day, n_events)
+    durations = rng.choice([0, 1, 29, 30, 95, 600, 2000], n_events)
+    return starts, durations
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("bucket_minutes", [15, 30, 60])
+def test_covered_minutes_match_a_loop_over_every_minute(seed, bucket_minutes):
+    starts, durations = random_events(seed)
+    expected = np.zeros((n_days, minutes_per_day // bucket_minutes), dtype=int)
+    for minute in range(n_days * minutes_per_day):
+        if any(start <= minute < start + duration for start, duration in zip(starts, durations)):
+            expected[minute // minutes_per_day, minute % minutes_per_day // bucket_minutes] += 1
+    np.testing.assert_array_equal(covered_minutes(starts, durations, n_days, bucket_minutes), expected)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_event_counts_match_a_loop_over_the_events(seed):
+    starts, _ = random_events(seed)
+    expected = np.zeros((n_days, minutes_per_day // 30), dtype=int)
+    for start in starts:
+        if 0 <= start < n_days * minutes_per_day:
+            expected[start // minutes_per_day, start % minutes_per_day // 30] += 1
+    np.testing.assert_array_equal(event_counts(starts, n_days, 30), expected)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_daily_feed_intervals_match_a_loop_over_the_feeds(seed):
+    feed_starts, _ = random_events(seed, n_events=15)
+    expected_sums, expected_counts = np.zeros(n_days), np.zeros(n_days)
+    feed_starts_sorted = sorted(feed_starts)
+    for previous, feed in zip(feed_starts_sorted, feed_starts_sorted[1:]):
+        day = feed // minutes_per_day
+        if 0 <= day < n_days and feed - previous <= max_feed_interval:
+            expected_sums[day] += feed - previous
+            expected_counts[day] += 1
+    sums, counts = daily_feed_intervals(feed_starts, n_days)
+    np.testing.assert_array_equal(sums, expected_sums)
+    np.testing.assert_array_equal(counts, expected_counts)
+
+
+def test_rolling_mean_matches_a_loop_over_the_windows():
+    sums, counts = np.array([3.0, 0, 5, 1, 0, 0, 0, 2]), np.array([1, 0, 2, 1, 0, 0, 0, 1])
+    for window in (1, 3, 7):
+        expected = [sum(sums[max(day + 1 - window, 0):day + 1]) / sum(counts[max(day + 1 - window, 0):day + 1])
+                    if sum(counts[max(day + 1 - window, 0):day + 1]) else np.nan for day in range(len(sums))]
+        np.testing.assert_array_equal(rolling_mean(sums, counts, window), expected)
@@ -0,0 +1,8 @@
+# entry point for running the app with a multi-worker WSGI server, e.g.
+#     gunicorn -c gunicorn.conf.py wsgi:server
+# every worker opens its own connection to Baby_Events.db, and notices writes made by the other workers through
+# SQLite's PRAGMA data_version and the change log, so each worker's caches stay up to date: the gantt segment cache
+# clears just the days that changed, and the versioned response cache rebuilds its figures and table pages
+from main import app
+
+server = app.server